@@ -0,0 +1,314 @@
+"""
+Adversarial Training Pipeline
+---------------------------
+This module trains the Siamese network with adversarial training (AT) on CPU,
+producing the weights behind the "AT Model" variants on the metrics page.
+
+Pipeline:
+- Gallery images (one sub-directory per class) are decoded once in parallel
+  with ``tf.data`` and cached as a uint8 tensor
+- Balanced same/different pairs are resampled every epoch, shuffled, batched,
+  gathered in parallel and prefetched
+- Optionally, both sides of every pair are augmented (data diversification,
+  see ``augmentation.py``) to train the "AT + DD" variant
+- For every batch, PGD adversarial pairs are generated in-graph from the
+  model's own gradients and trained on together with the clean pairs
+- Checkpoints are written every epoch so training can be resumed
+
+Usage:
+    python adversarial_training.py --data-dir path/to/gallery --epochs 10
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from image_utils import list_gallery
+
+IMAGE_SIZE = 28
+
+
+def sample_pairs(labels, n_pairs, rng):
+    """
+    Sample a balanced set of same-class and different-class index pairs.
+
+    Parameters:
+    -----------
+    labels : numpy.ndarray
+        Class label of each gallery image
+    n_pairs : int
+        Total number of pairs; half are positive, half negative
+    rng : numpy.random.Generator
+        Random generator used for sampling
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (index_a, index_b, target), where target is 1.0 for same-class pairs
+    """
+    order = np.argsort(labels, kind="stable")
+    classes, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    n_pos = n_pairs // 2
+    n_neg = n_pairs - n_pos
+
+    # Positive pairs: two draws from the same class (classes with >1 image)
+    multi = np.flatnonzero(counts > 1)
+    cls = rng.choice(multi, n_pos)
+    first = rng.integers(0, counts[cls])
+    second = (first + rng.integers(1, counts[cls])) % counts[cls]
+    pos_a = order[starts[cls] + first]
+    pos_b = order[starts[cls] + second]
+
+    # Negative pairs: two images whose labels differ
+    neg_a = rng.integers(0, len(labels), n_neg)
+    neg_b = rng.integers(0, len(labels), n_neg)
+    clash = labels[neg_a] == labels[neg_b]
+    while clash.any():
+        neg_b[clash] = rng.integers(0, len(labels), clash.sum())
+        clash = labels[neg_a] == labels[neg_b]
+
+    target = np.concatenate([np.ones(n_pos), np.zeros(n_neg)]).astype(np.float32)
+    return np.concatenate([pos_a, neg_a]), np.concatenate([pos_b, neg_b]), target
+
+
+def load_image(path):
+    """Decode one image to a (28, 28, 1) uint8 tensor, matching the app's preprocessing."""
+    img = tf.io.decode_image(tf.io.read_file(path), channels=1, expand_animations=False)
+    img = tf.image.resize(img, (IMAGE_SIZE, IMAGE_SIZE), method="bicubic", antialias=True)
+    return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8)
+
+
+def decode_gallery(paths, cache_path=""):
+    """
+    Decode every gallery image exactly once with a parallel ``tf.data`` map.
+
+    Parameters:
+    -----------
+    paths : list of str
+        Image paths
+    cache_path : str, optional
+        File prefix for ``Dataset.cache``; decoded images are reused across
+        runs. The default caches in memory only.
+
+    Returns:
+    --------
+    tf.Tensor
+        uint8 tensor of shape (N, 28, 28, 1)
+    """
+    images = (
+        tf.data.Dataset.from_tensor_slices(paths)
+        .map(load_image, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+        .cache(cache_path)
+        .batch(1024)
+        .prefetch(tf.data.AUTOTUNE)
+    )
+    return tf.concat(list(images), axis=0)
+
+
+def make_pair_dataset(images, labels, n_pairs, batch_size, seed, epoch, augment=False):
+    """
+    Build the input pipeline of clean pairs for one epoch.
+
+    Pairs (and augmentations, if ``augment`` is set) are drawn from
+    ``(seed, epoch)``, so a resumed run sees the same pairs it would have
+    seen without interruption.
+
+    Returns:
+    --------
+    tf.data.Dataset
+        Batches of (image_a, image_b, target) with float32 images in [0, 1]
+    """
+    index_a, index_b, target = sample_pairs(labels, n_pairs, np.random.default_rng([seed, epoch]))
+
+    def gather(a, b, y):
+        to_float = lambda idx: tf.cast(tf.gather(images, idx), tf.float32) / 255.0
+        return to_float(a), to_float(b), y
+
+    def diversify(step, batch):
+        from augmentation import augment_tensor
+
+        a, b, y = batch
+        return augment_tensor(a, [seed, epoch, step, 0]), augment_tensor(b, [seed, epoch, step, 1]), y
+
+    options = tf.data.Options()
+    options.autotune.enabled = True
+    options.experimental_optimization.map_parallelization = True
+    dataset = (
+        tf.data.Dataset.from_tensor_slices((index_a, index_b, target))
+        .shuffle(len(target), seed=seed + epoch)
+        .batch(batch_size, drop_remainder=True)
+        .map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    )
+    if augment:
+        dataset = dataset.enumerate().map(diversify, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.prefetch(tf.data.AUTOTUNE).with_options(options)
+
+
+def pgd_pairs(model, x_a, x_b, target, epsilon, alpha, steps):
+    """
+    Generate PGD adversarial versions of both images of every pair.
+
+    Starts from a random point in the L∞ ball and takes ``steps`` signed
+    gradient ascent steps on the binary cross-entropy of the pair score.
+
+    Parameters:
+    -----------
+    model : keras.Model
+        Siamese model taking ``[x_a, x_b]``
+    x_a, x_b : tf.Tensor
+        Clean image batches in [0, 1]
+    target : tf.Tensor
+        1.0 for same-class pairs, 0.0 otherwise
+    epsilon, alpha : float
+        Perturbation budget and step size, on the [0, 1] scale
+    steps : int
+        Number of PGD iterations
+
+    Returns:
+    --------
+    tuple of tf.Tensor
+        Adversarial (x_a, x_b) batches
+    """
+    loss_fn = tf.keras.losses.BinaryCrossentropy()
+    delta_a = tf.random.uniform(tf.shape(x_a), -epsilon, epsilon)
+    delta_b = tf.random.uniform(tf.shape(x_b), -epsilon, epsilon)
+    for _ in tf.range(steps):
+        with tf.GradientTape() as tape:
+            tape.watch([delta_a, delta_b])
+            score = model([tf.clip_by_value(x_a + delta_a, 0.0, 1.0), tf.clip_by_value(x_b + delta_b, 0.0, 1.0)], training=False)
+            loss = loss_fn(target[:, None], score)
+        grad_a, grad_b = tape.gradient(loss, [delta_a, delta_b])
+        delta_a = tf.clip_by_value(delta_a + alpha * tf.sign(grad_a), -epsilon, epsilon)
+        delta_b = tf.clip_by_value(delta_b + alpha * tf.sign(grad_b), -epsilon, epsilon)
+    return tf.clip_by_value(x_a + delta_a, 0.0, 1.0), tf.clip_by_value(x_b + delta_b, 0.0, 1.0)
+
+
+def make_train_step(model, optimizer, epsilon, alpha, steps):
+    """Compile one adversarial training step (PGD generation + update) into a graph."""
+    loss_fn = tf.keras.losses.BinaryCrossentropy()
+
+    @tf.function(reduce_retracing=True)
+    def train_step(x_a, x_b, target):
+        adv_a, adv_b = pgd_pairs(model, x_a, x_b, target, epsilon, alpha, steps)
+        inputs = [tf.concat([x_a, adv_a], axis=0), tf.concat([x_b, adv_b], axis=0)]
+        targets = tf.concat([target, target], axis=0)[:, None]
+        with tf.GradientTape() as tape:
+            score = model(inputs, training=True)
+            loss = loss_fn(targets, score)
+        grads = tape.gradient(loss, model.trainable_variables)
+        optimizer.apply_gradients(zip(grads, model.trainable_variables))
+        n_clean = tf.shape(target)[0]
+        correct = tf.cast(tf.equal(tf.cast(score > 0.5, tf.float32), targets), tf.float32)
+        return loss, tf.reduce_mean(correct[:n_clean]), tf.reduce_mean(correct[n_clean:])
+
+    return train_step
+
+
+def train(data_dir, output_dir="checkpoints", epochs=10, pairs_per_epoch=20000, batch_size=128,
+          epsilon=8.0, pgd_steps=7, learning_rate=1e-3, seed=0, cache_path="", augment=False):
+    """
+    Adversarially train the Siamese network, resuming from the latest checkpoint.
+
+    Parameters:
+    -----------
+    data_dir : str
+        Gallery root with one sub-directory per class
+    output_dir : str
+        Directory for checkpoints and the final ``siamese_at.weights.h5``
+    epochs : int
+        Total number of epochs (including those already completed)
+    pairs_per_epoch : int
+        Number of clean pairs sampled per epoch
+    batch_size : int
+        Clean pairs per batch; each batch also trains on as many adversarial pairs
+    epsilon : float
+        PGD budget in pixel units (0-255 scale), like the app's attack strength
+    pgd_steps : int
+        PGD iterations per batch
+    learning_rate : float
+        Adam learning rate
+    seed : int
+        Seed for pair sampling, shuffling and initialisation
+    cache_path : str, optional
+        File prefix for caching decoded gallery images across runs
+    augment : bool, optional
+        Apply data-diversification augmentation to every pair (AT + DD)
+
+    Returns:
+    --------
+    keras.Model
+        The trained Siamese model
+    """
+    from siamese_page import build_siamese_network
+
+    tf.keras.utils.set_random_seed(seed)
+    paths, labels, class_names = list_gallery(data_dir)
+    if len(class_names) < 2:
+        raise ValueError(f"Need at least two classes in {data_dir}, found {len(class_names)}")
+    images = decode_gallery(paths, cache_path)
+    print(f"Decoded {len(paths)} images in {len(class_names)} classes")
+
+    model = build_siamese_network()
+    optimizer = tf.keras.optimizers.Adam(learning_rate)
+    eps = epsilon / 255.0
+    train_step = make_train_step(model, optimizer, eps, 2.5 * eps / pgd_steps, pgd_steps)
+
+    epoch_var = tf.Variable(0, dtype=tf.int64, trainable=False)
+    checkpoint = tf.train.Checkpoint(model=model, optimizer=optimizer, epoch=epoch_var)
+    manager = tf.train.CheckpointManager(checkpoint, os.path.join(output_dir, "ckpt"), max_to_keep=3)
+    if manager.latest_checkpoint:
+        checkpoint.restore(manager.latest_checkpoint)
+        print(f"Resumed from {manager.latest_checkpoint} (epoch {int(epoch_var.numpy())})")
+
+    for epoch in range(int(epoch_var.numpy()), epochs):
+        dataset = make_pair_dataset(images, labels, pairs_per_epoch, batch_size, seed, epoch, augment)
+        losses, clean_acc, adv_acc = [], [], []
+        start = time.perf_counter()
+        for x_a, x_b, target in dataset:
+            loss, clean, adv = train_step(x_a, x_b, target)
+            losses.append(loss)
+            clean_acc.append(clean)
+            adv_acc.append(adv)
+        elapsed = time.perf_counter() - start
+        n_pairs = len(losses) * batch_size
+
+        epoch_var.assign(epoch + 1)
+        manager.save(checkpoint_number=epoch + 1)
+        print(
+            f"Epoch {epoch + 1}/{epochs}: loss={float(np.mean(losses)):.4f} "
+            f"clean_acc={float(np.mean(clean_acc)):.3f} adv_acc={float(np.mean(adv_acc)):.3f} "
+            f"throughput={n_pairs / elapsed:.0f} pairs/s"
+        )
+
+    model.save_weights(os.path.join(output_dir, "siamese_at.weights.h5"))
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adversarially train the FALCONNet Siamese network.")
+    parser.add_argument("--data-dir", required=True, help="Gallery root with one sub-directory per class")
+    parser.add_argument("--output-dir", default="checkpoints")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--pairs-per-epoch", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--epsilon", type=float, default=8.0, help="PGD budget on the 0-255 scale")
+    parser.add_argument("--pgd-steps", type=int, default=7)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache-path", default="", help="File prefix to cache decoded images across runs")
+    parser.add_argument("--augment", action="store_true", help="Add data-diversification augmentation (AT + DD)")
+    parser.add_argument("--threads", type=int, default=0, help="Intra-op threads (0 = all cores)")
+    args = parser.parse_args()
+
+    tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+    train(
+        args.data_dir, args.output_dir, args.epochs, args.pairs_per_epoch, args.batch_size,
+        args.epsilon, args.pgd_steps, args.learning_rate, args.seed, args.cache_path, args.augment,
+    )
+
+
+if __name__ == "__main__":
+    main()
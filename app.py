@@ -18,6 +18,8 @@ from select_page import select_character_attack_page
 from metrics_page import metrics_visualization_page
 from siamese_page import siamese_network_page
 from prototypical_page import prototypical_network_page
+from memory_governor import render_memory_sidebar
+from speculation import cancel_speculation, render_speculation_sidebar
 
 # Configure the main page layout
 st.set_page_config(
@@ -80,6 +82,12 @@ page_options = [
 selected = st.sidebar.radio('Go to', page_options, index=page_options.index(st.session_state.page))
 if selected != st.session_state.page:
     st.session_state.page = selected
+    # Work precomputed for the previous page is no longer needed
+    cancel_speculation()
+
+# Process and session memory usage, with budgets enforced on every rerun
+render_memory_sidebar()
+render_speculation_sidebar()
 
 # Route to appropriate page
 if st.session_state.page == 'Home':
@@ -7,13 +7,69 @@ neural network robustness. Currently supports:
 - Projected Gradient Descent (PGD)
 
 Each attack generates perturbations that can be applied to input images to test
-model behavior under adversarial conditions.
+model behavior under adversarial conditions. Large images can be attacked tile by
+tile with ``apply_attack_tiled`` so that memory use does not grow with image size.
 """
 
 import numpy as np
 from PIL import Image
 
-def apply_attack(image, attack_type="FGSM", strength=10.0):
+PGD_STEPS = 10
+DEFAULT_TILE_SIZE = 256
+
+
+def _random_sign(seed, step, index):
+    """
+    Deterministic ±1 values derived from (seed, step, flat pixel index).
+    
+    Uses the SplitMix64 finalizer, so every element only depends on its own
+    position: any tiling of the image produces exactly the same values.
+    """
+    # Python ints, so NumPy integer seeds (e.g. from rng.integers) cannot overflow
+    seed, step = int(seed), int(step)
+    x = index + np.uint64((seed * 0x9E3779B97F4A7C15 + step * 0xBF58476D1CE4E5B9) % 2**64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xBF58476D1CE4E5B9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94D049BB133111EB)
+    x ^= x >> np.uint64(31)
+    return np.where(x >> np.uint64(63), np.float32(1.0), np.float32(-1.0))
+
+
+def _flat_index(shape, rows, cols):
+    """Flat indices into an array of ``shape`` (H, W[, C]) for a rows x cols window."""
+    height, width = shape[:2]
+    channels = shape[2] if len(shape) == 3 else 1
+    r = np.arange(rows.start, rows.stop, dtype=np.uint64)[:, None, None]
+    c = np.arange(cols.start, cols.stop, dtype=np.uint64)[None, :, None]
+    ch = np.arange(channels, dtype=np.uint64)[None, None, :]
+    index = (r * np.uint64(width) + c) * np.uint64(channels) + ch
+    return index.reshape(index.shape[:2] + tuple(shape[2:]))
+
+
+def _perturb(img_array, attack_type, strength, gradient):
+    """
+    Apply an attack in place to a float32 array scaled to [0, 1].
+    
+    ``gradient(step)`` returns the (mock) gradient sign for the given step,
+    with the same shape as ``img_array``.
+    """
+    if attack_type == "FGSM":
+        img_array += strength * gradient(0) / 255.0
+    elif attack_type == "PGD":
+        noise = np.zeros_like(img_array)
+        alpha = strength / 10.0  # Step size for each iteration
+        epsilon = strength / 255.0  # Maximum perturbation
+        for step in range(PGD_STEPS):  # Assume 10 iterations for a stronger attack
+            noise += alpha * gradient(step)
+            np.clip(noise, -epsilon, epsilon, out=noise)
+        img_array += noise
+    np.clip(img_array, 0, 1, out=img_array)
+    img_array *= 255.0
+    return img_array
+
+
+def apply_attack(image, attack_type="FGSM", strength=10.0, seed=None):
     """
     Apply an adversarial attack to an input image.
     
@@ -29,6 +85,10 @@ def apply_attack(image, attack_type="FGSM", strength=10.0):
     strength : float
         Attack strength parameter (epsilon). Higher values create stronger attacks.
         Range: 0.0 to 10.0
+    seed : int, optional
+        If given, the perturbation is a deterministic function of the seed and
+        pixel position, and matches ``apply_attack_tiled`` with the same seed.
+        If None, NumPy's global random state is used.
     
     Returns:
     --------
@@ -37,23 +97,110 @@ def apply_attack(image, attack_type="FGSM", strength=10.0):
     """
     img_array = np.array(image).astype(np.float32) / 255.0
 
-    if attack_type == "None":
-        noise = 0
-    elif attack_type == "FGSM":
-        # Mock gradient for FGSM (replace with actual gradient computation in practice)
-        gradient = np.sign(np.random.uniform(-1, 1, img_array.shape))
-        noise = strength * gradient / 255.0
-    elif attack_type == "PGD":
-        # Stronger implementation for PGD attack
-        noise = np.zeros_like(img_array)
-        alpha = strength / 10.0  # Step size for each iteration
-        epsilon = strength / 255.0  # Maximum perturbation
-        for _ in range(10):  # Assume 10 iterations for a stronger attack
-            gradient = np.sign(np.random.uniform(-1, 1, img_array.shape))
-            noise = np.clip(noise + alpha * gradient, -epsilon, epsilon)
-        noise = np.clip(noise, -epsilon, epsilon)
+    if seed is None:
+        # Mock gradient (replace with actual gradient computation in practice)
+        def gradient(step):
+            return np.sign(np.random.uniform(-1, 1, img_array.shape)).astype(np.float32)
     else:
-        noise = 0
+        index = _flat_index(img_array.shape, slice(0, img_array.shape[0]), slice(0, img_array.shape[1]))
 
-    attacked = np.clip(img_array + noise, 0, 1) * 255.0
+        def gradient(step):
+            return _random_sign(seed, step, index)
+
+    attacked = _perturb(img_array, attack_type, strength, gradient)
     return Image.fromarray(attacked.astype(np.uint8))
+
+
+def apply_attack_batch(images, attack_type="FGSM", strength=10.0, seed=None):
+    """
+    Apply an adversarial attack to a batch of same-sized images in one pass.
+    
+    Parameters:
+    -----------
+    images : numpy.ndarray
+        uint8 batch of shape (N, H, W) or (N, H, W, C)
+    attack_type : str
+        Type of attack to apply ("FGSM", "PGD" or "None")
+    strength : float
+        Attack strength parameter (epsilon). Range: 0.0 to 10.0
+    seed : int, optional
+        If given, image ``i`` receives the same perturbation as
+        ``apply_attack(image_i, ..., seed=seed + i)``. If None, NumPy's global
+        random state is used.
+    
+    Returns:
+    --------
+    numpy.ndarray
+        uint8 batch of attacked images with the same shape as ``images``
+    """
+    img_array = np.asarray(images).astype(np.float32) / 255.0
+
+    if seed is None:
+        def gradient(step):
+            return np.sign(np.random.uniform(-1, 1, img_array.shape)).astype(np.float32)
+    else:
+        image_index = _flat_index(img_array.shape[1:], slice(0, img_array.shape[1]), slice(0, img_array.shape[2]))
+        # Folds seed + i into the index, as _random_sign does with the seed (uint64 arithmetic wraps)
+        offset = np.arange(len(img_array), dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        index = offset.reshape((-1,) + (1,) * image_index.ndim) + image_index
+
+        def gradient(step):
+            return _random_sign(seed, step, index)
+
+    return _perturb(img_array, attack_type, strength, gradient).astype(np.uint8)
+
+
+def apply_attack_tiled(image, attack_type="FGSM", strength=10.0, seed=None,
+                       tile_size=DEFAULT_TILE_SIZE, scratch_path=None):
+    """
+    Apply an adversarial attack tile by tile with bounded memory.
+    
+    Only one ``tile_size`` x ``tile_size`` tile is ever held in float32, so the
+    working memory stays constant regardless of image size. The result is
+    identical to ``apply_attack`` with the same seed.
+    
+    Parameters:
+    -----------
+    image : PIL.Image or numpy.ndarray
+        The input image (uint8, shape (H, W) or (H, W, C)). A ``numpy.memmap``
+        may be passed to avoid loading the source into memory.
+    attack_type : str
+        Type of attack to apply ("FGSM", "PGD" or "None")
+    strength : float
+        Attack strength parameter (epsilon). Range: 0.0 to 10.0
+    seed : int, optional
+        Seed for the perturbation. If None, one is drawn from NumPy's global
+        random state.
+    tile_size : int, optional
+        Side length of the square tiles
+    scratch_path : str, optional
+        If given, the attacked image is written to a memory-mapped file at this
+        path instead of an in-memory array.
+    
+    Returns:
+    --------
+    PIL.Image or numpy.ndarray
+        A PIL image if ``image`` was a PIL image, otherwise a uint8 array
+        (a ``numpy.memmap`` when ``scratch_path`` is given)
+    """
+    from image_utils import iter_tiles
+
+    source = np.asarray(image)
+    if seed is None:
+        seed = int(np.random.randint(0, 2**31))
+
+    if scratch_path is not None:
+        attacked = np.lib.format.open_memmap(scratch_path, mode="w+", dtype=np.uint8, shape=source.shape)
+    else:
+        attacked = np.empty(source.shape, dtype=np.uint8)
+
+    for rows, cols in iter_tiles(source.shape[0], source.shape[1], tile_size):
+        tile = source[rows, cols].astype(np.float32) / 255.0
+        index = _flat_index(source.shape, rows, cols)
+        attacked[rows, cols] = _perturb(tile, attack_type, strength, lambda step: _random_sign(seed, step, index))
+
+    if isinstance(attacked, np.memmap):
+        attacked.flush()
+    if isinstance(image, Image.Image):
+        return Image.fromarray(attacked)
+    return attacked
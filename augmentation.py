@@ -0,0 +1,265 @@
+"""
+Batch Augmentation Module
+-----------------------
+This module implements the data-diversification (DD) step behind the "DD Model"
+and "AT + DD Model" variants. Whole (N, 28, 28) batches are augmented at once
+with vectorized NumPy operations:
+- Random affine transforms (rotation, scale, shear, translation)
+- Elastic distortion (Gaussian-smoothed random displacement fields)
+- Stroke thickening / thinning (cross-shaped grayscale morphology)
+- Additive Gaussian noise
+
+The affine and elastic warps are combined into a single bilinear resampling
+pass. Augmentation is seedable and can run as a standalone generator or as a
+``tf.data`` stage.
+
+Usage:
+    python augmentation.py --benchmark
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+
+def _gaussian_smooth(field, sigma):
+    """Separable Gaussian blur along the H and W axes of an (N, H, W) array."""
+    radius = max(1, int(np.ceil(3 * sigma)))
+    taps = np.exp(-0.5 * (np.arange(-radius, radius + 1) / sigma) ** 2).astype(np.float32)
+    taps /= taps.sum()
+    for axis in (1, 2):
+        pad = [(0, 0)] * field.ndim
+        pad[axis] = (radius, radius)
+        padded = np.pad(field, pad, mode="edge")
+        size = field.shape[axis]
+        out = np.zeros_like(field)
+        for k, tap in enumerate(taps):
+            index = [slice(None)] * field.ndim
+            index[axis] = slice(k, k + size)
+            out += tap * padded[tuple(index)]
+        field = out
+    return field
+
+
+def _bilinear_sample(images, ys, xs, fill):
+    """Sample (N, H, W) images at per-pixel source coordinates, with ``fill`` outside."""
+    n, h, w = images.shape
+    padded = np.pad(images, ((0, 0), (1, 1), (1, 1)), constant_values=fill).reshape(-1)
+
+    ys = np.clip(ys, -1, h)
+    xs = np.clip(xs, -1, w)
+    y0 = np.floor(ys)
+    x0 = np.floor(xs)
+    wy = (ys - y0).astype(np.float32)
+    wx = (xs - x0).astype(np.float32)
+    # Shift by one for the padding border, which holds the fill value
+    y0 = y0.astype(np.int64) + 1
+    x0 = x0.astype(np.int64) + 1
+    y1 = np.minimum(y0 + 1, h + 1)
+    x1 = np.minimum(x0 + 1, w + 1)
+
+    base = (np.arange(n) * (h + 2) * (w + 2))[:, None, None]
+    top = (1 - wx) * padded[base + y0 * (w + 2) + x0] + wx * padded[base + y0 * (w + 2) + x1]
+    bottom = (1 - wx) * padded[base + y1 * (w + 2) + x0] + wx * padded[base + y1 * (w + 2) + x1]
+    return (1 - wy) * top + wy * bottom
+
+
+def _morphology(images, reduce, fill):
+    """Grayscale min or max filter with a 3x3 cross over an (N, H, W) batch."""
+    n, h, w = images.shape
+    padded = np.pad(images, ((0, 0), (1, 1), (1, 1)), constant_values=fill)
+    out = images.copy()
+    for dy, dx in ((0, 1), (2, 1), (1, 0), (1, 2)):
+        reduce(out, padded[:, dy:dy + h, dx:dx + w], out=out)
+    return out
+
+
+def augment_batch(images, rng, max_rotation=15.0, max_scale=0.1, max_shear=0.2,
+                  max_translation=2.0, elastic_prob=0.5, elastic_alpha=2.0,
+                  elastic_sigma=3.0, stroke_prob=0.5, max_noise=0.05,
+                  dark_strokes=True):
+    """
+    Augment a batch of character images in a single vectorized pass.
+
+    Parameters:
+    -----------
+    images : numpy.ndarray
+        float32 batch in [0, 1] of shape (N, H, W) or (N, H, W, 1)
+    rng : numpy.random.Generator
+        Source of randomness; the same generator state gives the same output
+    max_rotation : float
+        Maximum rotation in degrees
+    max_scale : float
+        Maximum relative change in scale
+    max_shear : float
+        Maximum horizontal shear factor
+    max_translation : float
+        Maximum shift in pixels along each axis
+    elastic_prob : float
+        Probability of applying elastic distortion to each image
+    elastic_alpha, elastic_sigma : float
+        Displacement magnitude (pixels) and smoothness of the elastic field
+    stroke_prob : float
+        Probability of thickening or thinning the strokes of each image
+        (split evenly between the two), blended in at a random strength
+    max_noise : float
+        Maximum standard deviation of the additive Gaussian noise
+    dark_strokes : bool
+        True for dark strokes on a light background (as in the bundled
+        characters and Omniglot), False for light strokes on dark
+
+    Returns:
+    --------
+    numpy.ndarray
+        Augmented float32 batch with the same shape as ``images``
+    """
+    shape = images.shape
+    batch = np.asarray(images, dtype=np.float32).reshape(shape[:3])
+    n, h, w = batch.shape
+    background = 1.0 if dark_strokes else 0.0
+
+    # Random affine matrix per image, mapping output to source coordinates
+    theta = np.deg2rad(rng.uniform(-max_rotation, max_rotation, n))
+    scale = rng.uniform(1 - max_scale, 1 + max_scale, n)
+    shear = rng.uniform(-max_shear, max_shear, n)
+    cos, sin = np.cos(theta) / scale, np.sin(theta) / scale
+    affine = np.stack([
+        np.stack([cos, cos * shear - sin], axis=-1),
+        np.stack([sin, sin * shear + cos], axis=-1),
+    ], axis=1).astype(np.float32)
+    shift = rng.uniform(-max_translation, max_translation, (n, 2)).astype(np.float32)
+
+    center = np.array([(h - 1) / 2, (w - 1) / 2], dtype=np.float32)
+    grid = np.stack(np.meshgrid(np.arange(h), np.arange(w), indexing="ij"), axis=-1).astype(np.float32) - center
+    coords = np.einsum("nij,hwj->nhwi", affine, grid) + center + shift[:, None, None, :]
+
+    # Elastic distortion on a random subset of the batch
+    elastic = rng.random(n) < elastic_prob
+    if elastic.any():
+        field = rng.uniform(-1, 1, (int(elastic.sum()), h, w, 2)).astype(np.float32)
+        field = _gaussian_smooth(field.transpose(3, 0, 1, 2).reshape(-1, h, w), elastic_sigma)
+        field = field.reshape(2, -1, h, w).transpose(1, 2, 3, 0)
+        field *= elastic_alpha / (np.abs(field).max(axis=(1, 2, 3), keepdims=True) + 1e-6)
+        coords[elastic] += field
+
+    batch = _bilinear_sample(batch, coords[..., 0], coords[..., 1], background)
+
+    # Stroke thickness: choose thicken / thin / keep per image
+    stroke = rng.random(n)
+    thicken = (stroke < stroke_prob / 2)[:, None, None]
+    thin = ((stroke >= stroke_prob / 2) & (stroke < stroke_prob))[:, None, None]
+    if thicken.any() or thin.any():
+        darker = _morphology(batch, np.minimum, background)
+        lighter = _morphology(batch, np.maximum, background)
+        thick, slim = (darker, lighter) if dark_strokes else (lighter, darker)
+        strength = rng.uniform(0.3, 1.0, (n, 1, 1)).astype(np.float32)
+        target = np.where(thicken, thick, np.where(thin, slim, batch))
+        batch += strength * (target - batch)
+
+    # Additive Gaussian noise with a random level per image
+    sigma = rng.uniform(0, max_noise, (n, 1, 1)).astype(np.float32)
+    batch += sigma * rng.standard_normal((n, h, w), dtype=np.float32)
+    np.clip(batch, 0.0, 1.0, out=batch)
+    return batch.reshape(shape)
+
+
+def augmentation_generator(images, batch_size=256, seed=0, **params):
+    """
+    Yield augmented batches from a fixed image array, indefinitely.
+
+    Parameters:
+    -----------
+    images : numpy.ndarray
+        float32 images in [0, 1] of shape (N, H, W) or (N, H, W, 1)
+    batch_size : int
+        Number of images per batch
+    seed : int
+        Seed for sampling and augmentation
+    **params
+        Passed to ``augment_batch``
+
+    Yields:
+    -------
+    numpy.ndarray
+        Augmented batches of shape (batch_size, ...)
+    """
+    rng = np.random.default_rng(seed)
+    while True:
+        index = rng.integers(0, len(images), batch_size)
+        yield augment_batch(images[index], rng, **params)
+
+
+def augment_tensor(images, seed, **params):
+    """
+    ``tf.data`` stage: augment a float32 image batch tensor.
+
+    The NumPy engine runs through ``tf.numpy_function`` with a generator
+    seeded from ``seed``, so a parallel ``map`` stays deterministic when each
+    batch gets its own seed (e.g. from ``Dataset.enumerate``).
+
+    Parameters:
+    -----------
+    images : tf.Tensor
+        float32 batch of shape (N, H, W) or (N, H, W, 1)
+    seed : tf.Tensor
+        int64 scalar or vector seed for this batch
+    **params
+        Passed to ``augment_batch``
+
+    Returns:
+    --------
+    tf.Tensor
+        Augmented batch with the same shape as ``images``
+    """
+    import tensorflow as tf
+
+    def augment(batch, batch_seed):
+        rng = np.random.default_rng(np.atleast_1d(batch_seed).astype(np.uint64).tolist())
+        return augment_batch(batch, rng, **params)
+
+    augmented = tf.numpy_function(augment, [images, tf.cast(seed, tf.int64)], tf.float32, stateful=False)
+    augmented.set_shape(images.shape)
+    return augmented
+
+
+def benchmark(n_images=100000, batch_size=1024, seed=0):
+    """
+    Measure augmentation throughput on CPU using the bundled characters.
+
+    Returns:
+    --------
+    float
+        Augmented images per second
+    """
+    from image_utils import load_sample_characters
+
+    chars = [np.asarray(img.convert("L").resize((28, 28)), dtype=np.float32) / 255.0
+             for img in load_sample_characters().values()]
+    images = np.stack(chars)
+    batches = augmentation_generator(images, batch_size, seed)
+    next(batches)  # warm up
+
+    start = time.perf_counter()
+    done = 0
+    while done < n_images:
+        done += len(next(batches))
+    return done / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FALCONNet batch augmentation engine.")
+    parser.add_argument("--benchmark", action="store_true", help="Report augmented images/s on CPU")
+    parser.add_argument("--images", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        rate = benchmark(args.images, args.batch_size)
+        print(f"Augmented {args.images} images at {rate:.0f} images/s (batch size {args.batch_size})")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
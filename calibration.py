@@ -0,0 +1,385 @@
+"""
+Verification Calibration Module
+-----------------------------
+This module turns the Siamese network's sigmoid similarity score into a
+same/different decision:
+- Every labelled gallery pair is scored with batched forward passes: the
+  gallery is embedded once, then pair scores are computed for blocks of rows
+  with the similarity head
+- ROC, AUC, equal error rate (EER) and the threshold maximising Youden's J
+  (TPR - FPR) are computed by sorting the scores once and taking cumulative
+  sums of positives and negatives, with no loop over thresholds
+- Scores are accumulated chunk by chunk, so millions of pairs never have to
+  be scored at once; with ``bins`` set, only fixed-size score histograms are
+  kept and memory no longer grows with the number of pairs
+
+The threshold is calibrated on clean pairs and also evaluated on pairs whose
+second image is attacked. Results are written next to the per-sample results
+store for the metrics dashboard and the Siamese page, together with the path
+and content hash of the weights they were computed with, so a calibration
+for other weights is never applied to the model on screen.
+
+Usage:
+    python calibration.py --data-dir path/to/gallery --weights checkpoints/siamese.npz --store results_store
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from results_store import RESULTS_STORE
+
+SUMMARY_FILE = "calibration_summary.parquet"
+CURVES_FILE = "calibration_curves.parquet"
+# Points kept per stored ROC curve
+CURVE_POINTS = 512
+# Summary columns identifying the weights a calibration was computed with
+SUMMARY_WEIGHTS_COLUMNS = ["Weights", "Weights Hash"]
+# A clean AUC closer to 0.5 than this means the scores do not separate the pairs
+CHANCE_AUC_MARGIN = 0.02
+
+
+def roc_curve(scores, same):
+    """
+    ROC curve of similarity scores, from a single sort.
+
+    Parameters:
+    -----------
+    scores : numpy.ndarray
+        Similarity score of each pair (higher means more similar)
+    same : numpy.ndarray
+        True for same-class pairs
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (false positive rates, true positive rates, thresholds), one point per
+        distinct score plus the (0, 0) point; a pair is accepted as "same"
+        when its score is >= the threshold
+    """
+    order = np.argsort(scores, kind="stable")[::-1]
+    sorted_scores = np.asarray(scores)[order]
+    sorted_same = np.asarray(same, dtype=bool)[order]
+    # Last position of each run of equal scores
+    last = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+    true_positives = np.cumsum(sorted_same)[last]
+    false_positives = (last + 1) - true_positives
+    return _rates(true_positives, false_positives, sorted_scores[last])
+
+
+def roc_from_histograms(positive_counts, negative_counts, edges):
+    """
+    ROC curve from per-bin counts of same-class and different-class scores.
+
+    The thresholds are the lower bin edges, so the curve is exact at bin
+    resolution.
+    """
+    true_positives = np.cumsum(positive_counts[::-1])
+    false_positives = np.cumsum(negative_counts[::-1])
+    return _rates(true_positives, false_positives, edges[:-1][::-1])
+
+
+def _rates(true_positives, false_positives, thresholds):
+    positives = max(int(true_positives[-1]), 1)
+    negatives = max(int(false_positives[-1]), 1)
+    fpr = np.r_[0.0, false_positives / negatives]
+    tpr = np.r_[0.0, true_positives / positives]
+    return fpr, tpr, np.r_[np.inf, thresholds]
+
+
+def area_under_curve(fpr, tpr):
+    """Trapezoidal area under a ROC curve."""
+    return float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2))
+
+
+def equal_error_rate(fpr, tpr, thresholds):
+    """
+    Equal error rate and its threshold.
+
+    The point where the false positive rate equals the false negative rate
+    (1 - TPR), interpolated linearly between the two ROC points around it.
+
+    Returns:
+    --------
+    tuple of float
+        (EER, threshold)
+    """
+    gap = fpr - (1 - tpr)  # increases along the curve, from -1 to 1
+    i = max(int(np.searchsorted(gap, 0.0)), 1)
+    weight = -gap[i - 1] / (gap[i] - gap[i - 1]) if gap[i] != gap[i - 1] else 0.0
+    eer = fpr[i - 1] + weight * (fpr[i] - fpr[i - 1])
+    low = thresholds[i - 1] if np.isfinite(thresholds[i - 1]) else thresholds[i]
+    return float(eer), float(low + weight * (thresholds[i] - low))
+
+
+def best_threshold(fpr, tpr, thresholds):
+    """
+    Threshold maximising Youden's J statistic (TPR - FPR).
+
+    The leading (0, 0) point, whose threshold is infinite, is never chosen;
+    when no threshold beats chance (J <= 0), the EER threshold is returned.
+    """
+    j = tpr[1:] - fpr[1:]
+    i = int(np.argmax(j))
+    if j[i] <= 0:
+        return equal_error_rate(fpr, tpr, thresholds)[1]
+    return float(thresholds[i + 1])
+
+
+def near_chance(auc, margin=CHANCE_AUC_MARGIN):
+    """Whether an AUC is too close to 0.5 for a calibrated threshold to mean anything."""
+    return abs(auc - 0.5) < margin
+
+
+def rates_at(fpr, tpr, thresholds, threshold):
+    """(FPR, TPR) when accepting scores >= ``threshold``."""
+    i = int(np.searchsorted(-thresholds, -threshold, side="right")) - 1
+    return float(fpr[i]), float(tpr[i])
+
+
+class ROCAccumulator:
+    """
+    Collects scored pairs chunk by chunk and computes the ROC at the end.
+
+    Parameters:
+    -----------
+    bins : int, optional
+        If given, scores in [0, 1] are counted in this many histogram bins
+        (constant memory); otherwise all scores are kept and the curve is exact
+    """
+
+    def __init__(self, bins=None):
+        self.bins = bins
+        self.chunks = []
+        if bins is not None:
+            self.edges = np.linspace(0.0, 1.0, bins + 1)
+            self.positive = np.zeros(bins, dtype=np.int64)
+            self.negative = np.zeros(bins, dtype=np.int64)
+
+    def add(self, scores, same):
+        if self.bins is None:
+            self.chunks.append((np.asarray(scores, dtype=np.float32), np.asarray(same, dtype=bool)))
+            return
+        index = np.clip((np.asarray(scores) * self.bins).astype(np.int64), 0, self.bins - 1)
+        self.positive += np.bincount(index[same], minlength=self.bins)
+        self.negative += np.bincount(index[~same], minlength=self.bins)
+
+    def curve(self):
+        """(fpr, tpr, thresholds) of everything added so far."""
+        if self.bins is not None:
+            return roc_from_histograms(self.positive, self.negative, self.edges)
+        scores = np.concatenate([scores for scores, _ in self.chunks])
+        same = np.concatenate([same for _, same in self.chunks])
+        return roc_curve(scores, same)
+
+
+def iter_pair_scores(embeddings_a, embeddings_b, labels, score_fn, chunk_pairs=1 << 20, symmetric=True):
+    """
+    Score gallery pairs in chunks of whole rows.
+
+    Parameters:
+    -----------
+    embeddings_a, embeddings_b : numpy.ndarray
+        (N, D) embeddings of the first and second image of each pair
+    labels : numpy.ndarray
+        Class label of each gallery image
+    score_fn : callable
+        Maps two (M, D) embedding arrays to M similarity scores
+    chunk_pairs : int
+        Approximate number of pairs scored per chunk
+    symmetric : bool
+        If True (both sides from the same gallery), only pairs i < j are
+        scored; otherwise all pairs i != j
+
+    Yields:
+    -------
+    tuple of numpy.ndarray
+        (scores, same-class flags) for one chunk
+    """
+    n = len(labels)
+    rows = max(1, chunk_pairs // max(n, 1))
+    columns = np.arange(n)
+    for start in range(0, n, rows):
+        i = np.arange(start, min(start + rows, n))
+        keep = columns[None, :] > i[:, None] if symmetric else columns[None, :] != i[:, None]
+        a, b = np.nonzero(keep)
+        a = i[a]
+        yield score_fn(embeddings_a[a], embeddings_b[b]), labels[a] == labels[b]
+
+
+def calibrate(embeddings_a, embeddings_b, labels, score_fn, chunk_pairs=1 << 20, bins=None, symmetric=True):
+    """
+    ROC curve of all gallery pairs, streamed chunk by chunk.
+
+    Returns:
+    --------
+    tuple
+        (fpr, tpr, thresholds, number of pairs)
+    """
+    accumulator = ROCAccumulator(bins)
+    n_pairs = 0
+    for scores, same in iter_pair_scores(embeddings_a, embeddings_b, labels, score_fn, chunk_pairs, symmetric):
+        accumulator.add(scores, same)
+        n_pairs += len(scores)
+    return (*accumulator.curve(), n_pairs)
+
+
+def thin_curve(fpr, tpr, thresholds, points=CURVE_POINTS):
+    """Keep about ``points`` evenly spaced points of a curve, including both ends."""
+    keep = np.unique(np.linspace(0, len(fpr) - 1, min(points, len(fpr))).round().astype(int))
+    return fpr[keep], tpr[keep], thresholds[keep]
+
+
+def calibrate_gallery(gallery, labels, engine, attacks=(("FGSM", 5.0), ("PGD", 5.0)),
+                      seed=0, chunk_pairs=1 << 20, bins=None, weights_source="unknown"):
+    """
+    Calibrate the verification threshold on a gallery and evaluate it under attack.
+
+    The threshold (Youden's J) is chosen on clean pairs. For each attack, the
+    gallery is attacked once and pairs of a clean and an attacked image are
+    scored against the clean threshold.
+
+    Parameters:
+    -----------
+    gallery : numpy.ndarray
+        uint8 gallery images of shape (N, 28, 28)
+    labels : numpy.ndarray
+        Class label of each gallery image
+    engine : numpy_siamese.SiameseEngine
+        Network used to embed and score pairs
+    attacks : sequence of tuple
+        (attack type, strength) pairs
+    seed : int
+        Seed for the attacks
+    chunk_pairs : int
+        Pairs scored per chunk
+    bins : int, optional
+        Histogram bins for constant-memory accumulation
+    weights_source : str
+        Where the engine's weights came from, stored with their hash
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (one summary row per condition, thinned ROC curves of all conditions)
+    """
+    from attacks import apply_attack_batch
+    from episodic_evaluation import embed_gallery
+    from numpy_siamese import weights_fingerprint
+
+    def embed(images):
+        return embed_gallery(images, lambda batch: engine.embed(batch[..., None] / np.float32(255.0)))
+
+    clean = embed(gallery)
+    conditions = [("Clean", clean, True)] + [
+        (f"{attack_type} ({strength:g})", embed(apply_attack_batch(gallery, attack_type, strength, seed=seed)), False)
+        for attack_type, strength in attacks
+    ]
+
+    rows, curves, threshold = [], [], None
+    for name, embeddings, symmetric in conditions:
+        fpr, tpr, thresholds, n_pairs = calibrate(
+            clean, embeddings, labels, engine.score_embeddings, chunk_pairs, bins, symmetric
+        )
+        if threshold is None:
+            threshold = best_threshold(fpr, tpr, thresholds)
+        eer, eer_threshold = equal_error_rate(fpr, tpr, thresholds)
+        fpr_at, tpr_at = rates_at(fpr, tpr, thresholds, threshold)
+        rows.append({
+            "Condition": name, "Pairs": n_pairs, "AUC": area_under_curve(fpr, tpr),
+            "EER": eer, "EER Threshold": eer_threshold, "Threshold": threshold,
+            "TPR": tpr_at, "FPR": fpr_at,
+            "Weights": weights_source, "Weights Hash": weights_fingerprint(engine.weights),
+        })
+        fpr, tpr, thresholds = thin_curve(fpr, tpr, thresholds)
+        curves.append(pd.DataFrame({"Condition": name, "FPR": fpr, "TPR": tpr, "Threshold": thresholds}))
+    return pd.DataFrame(rows), pd.concat(curves, ignore_index=True)
+
+
+def save_calibration(summary, curves, store_dir):
+    os.makedirs(store_dir, exist_ok=True)
+    summary.to_parquet(os.path.join(store_dir, SUMMARY_FILE), index=False)
+    curves.to_parquet(os.path.join(store_dir, CURVES_FILE), index=False)
+
+
+def has_calibration(store_dir):
+    return os.path.exists(os.path.join(store_dir, SUMMARY_FILE))
+
+
+def load_calibration(store_dir):
+    """(summary, curves) written by ``save_calibration``."""
+    return (pd.read_parquet(os.path.join(store_dir, SUMMARY_FILE)),
+            pd.read_parquet(os.path.join(store_dir, CURVES_FILE)))
+
+
+def calibration_for_weights(weights, weights_source, store_dir):
+    """
+    Calibration for a given set of weights.
+
+    The stored calibration is used if it was computed with the same weights
+    (by content hash); otherwise the weights are calibrated on the bundled
+    sample gallery.
+
+    Parameters:
+    -----------
+    weights : dict
+        Weights as returned by ``numpy_siamese.export_weights``
+    weights_source : str
+        Where the weights came from
+    store_dir : str
+        Results store directory
+
+    Returns:
+    --------
+    tuple
+        (summary, curves, source of the stored calibration's weights if it
+        was skipped for not matching, else None)
+    """
+    from episodic_evaluation import build_sample_gallery
+    from numpy_siamese import SiameseEngine, weights_fingerprint
+
+    skipped = None
+    if has_calibration(store_dir):
+        summary, curves = load_calibration(store_dir)
+        if "Weights Hash" in summary and summary["Weights Hash"].iloc[0] == weights_fingerprint(weights):
+            return summary, curves, None
+        skipped = summary["Weights"].iloc[0] if "Weights" in summary else "unknown weights"
+    gallery, labels, _ = build_sample_gallery()
+    return (*calibrate_gallery(gallery, labels, SiameseEngine(weights), weights_source=weights_source), skipped)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the Siamese network's verification threshold.")
+    parser.add_argument("--data-dir", help="Gallery root with one sub-directory per class "
+                                           "(default: augmented bundled characters)")
+    parser.add_argument("--weights", default=os.path.join("checkpoints", "siamese.npz"),
+                        help="NumPy weights from numpy_siamese.py --export")
+    parser.add_argument("--store", default=RESULTS_STORE, help="Results store directory to write to")
+    parser.add_argument("--strength", type=float, default=5.0, help="FGSM/PGD attack strength")
+    parser.add_argument("--chunk-pairs", type=int, default=1 << 20, help="Pairs scored per chunk")
+    parser.add_argument("--bins", type=int, help="Accumulate score histograms with this many bins "
+                                                 "instead of keeping every score")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from episodic_evaluation import build_sample_gallery
+    from image_utils import load_gallery
+    from numpy_siamese import SiameseEngine
+
+    if args.data_dir:
+        gallery, labels, _ = load_gallery(args.data_dir)
+    else:
+        gallery, labels, _ = build_sample_gallery(seed=args.seed)
+    summary, curves = calibrate_gallery(
+        gallery, labels, SiameseEngine(args.weights),
+        attacks=(("FGSM", args.strength), ("PGD", args.strength)),
+        seed=args.seed, chunk_pairs=args.chunk_pairs, bins=args.bins, weights_source=args.weights,
+    )
+    save_calibration(summary, curves, args.store)
+    print(summary.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,7 @@ def draw_character_attack_page():
     import numpy as np
     from PIL import Image
     from streamlit_drawable_canvas import st_canvas
-    from attacks import apply_attack
-    from image_utils import compute_mse, compute_difference_heatmap
+    from speculation import STRENGTH_STEP, cached_result, speculate_neighbours
 
     st.title("🖌️ Draw Character & Attack Playground")
 
@@ -68,10 +67,12 @@ def draw_character_attack_page():
     attack_type = st.selectbox(
         "Choose Attack Type", ["FGSM", "PGD"]
     )
-    attack_strength = st.slider("Attack Strength", 0.0, 10.0, 5.0)
+    attack_strength = st.slider("Attack Strength", 0.0, 10.0, 5.0, step=STRENGTH_STEP)
 
     if canvas_result.image_data is not None and st.button("Apply Attack"):
-        attacked_img = apply_attack(drawn_img, attack_type, attack_strength)
+        # Attack, metrics and heatmap, usually precomputed by the previous run
+        analysis = cached_result("analysis", drawn_img, attack_type, attack_strength)
+        attacked_img = analysis["attacked"]
 
         st.markdown("### Original vs Attacked Image")
         col3, col4 = st.columns([1, 1])
@@ -101,16 +102,21 @@ def draw_character_attack_page():
             """<div class="pixel-analysis">
             <b>Pixel-Level Analysis</b> provides insights into how the attack has altered the image.<br>
             - <b>MSE (Mean Squared Error):</b> Measures the average squared difference between the original and attacked images.<br>
+            - <b>PSNR / SSIM:</b> Signal-to-noise ratio and structural similarity of the attacked image.<br>
+            - <b>L∞ / L2 / L0:</b> Largest change, overall size of the change, and number of changed pixel values.<br>
             - <b>Heatmap:</b> Highlights the regions most affected by the attack.
             </div>""",
             unsafe_allow_html=True
         )
 
-        mse = compute_mse(drawn_img, attacked_img)
+        metrics = analysis["metrics"]
+        mse = metrics["MSE"].iloc[0]
         st.markdown(
             f"<h5 style='text-align: center;'>MSE: {mse:.2f}</h5>",
             unsafe_allow_html=True,
         )
+        st.dataframe(metrics, hide_index=True, use_container_width=True)
 
-        fig = compute_difference_heatmap(drawn_img, attacked_img, small=True)
-        st.pyplot(fig)
+        st.image(analysis["heatmap"], use_container_width=True)
+
+        speculate_neighbours("draw", "analysis", drawn_img, attack_type, attack_strength)
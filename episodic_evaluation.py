@@ -0,0 +1,241 @@
+"""
+Episodic Evaluation Engine
+------------------------
+This module evaluates a prototypical network on thousands of N-way K-shot
+episodes sampled from a gallery, for clean and attacked queries.
+
+Every gallery image is embedded exactly once (and once more per attack); the
+episodes then only index into those embeddings, so prototypes and query
+distances for a whole chunk of episodes are computed with batched gathers and
+matrix products instead of re-embedding images per episode.
+
+Usage:
+    python episodic_evaluation.py --data-dir path/to/gallery --n-way 5 --k-shot 1
+"""
+
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+
+def build_sample_gallery(n_per_class=20, seed=0):
+    """
+    Build a small gallery from the bundled characters using DD augmentation.
+
+    Returns:
+    --------
+    tuple
+        (uint8 array of shape (N, 28, 28), int32 labels, list of class names)
+    """
+    from augmentation import augment_batch
+    from image_utils import load_sample_characters
+
+    characters = load_sample_characters()
+    base = np.stack([np.asarray(img.convert("L").resize((28, 28)), dtype=np.float32) / 255.0
+                     for img in characters.values()])
+    images = augment_batch(np.repeat(base, n_per_class, axis=0), np.random.default_rng(seed))
+    labels = np.repeat(np.arange(len(base), dtype=np.int32), n_per_class)
+    return np.round(images * 255).astype(np.uint8), labels, list(characters)
+
+
+def embed_gallery(images, embed_fn, batch_size=1024):
+    """
+    Embed every gallery image once, in batches.
+
+    Parameters:
+    -----------
+    images : numpy.ndarray
+        uint8 gallery of shape (N, H, W) or (N, H, W, C)
+    embed_fn : callable
+        Maps a uint8 batch to a (batch, D) array of embeddings
+    batch_size : int
+        Number of images per call to ``embed_fn``
+
+    Returns:
+    --------
+    numpy.ndarray
+        float32 embeddings of shape (N, D)
+    """
+    return np.concatenate([
+        np.asarray(embed_fn(images[i:i + batch_size]), dtype=np.float32)
+        for i in range(0, len(images), batch_size)
+    ])
+
+
+def sample_episodes(labels, n_episodes, n_way, k_shot, n_query, rng):
+    """
+    Sample N-way K-shot episodes as index arrays into the gallery.
+
+    Each episode draws ``n_way`` distinct classes, then ``k_shot + n_query``
+    distinct images per class, all vectorized over episodes.
+
+    Parameters:
+    -----------
+    labels : numpy.ndarray
+        Class label of each gallery image
+    n_episodes, n_way, k_shot, n_query : int
+        Number of episodes, classes per episode, support and query images per class
+    rng : numpy.random.Generator
+        Random generator used for sampling
+
+    Returns:
+    --------
+    tuple of numpy.ndarray
+        (support indices of shape (E, n_way, k_shot),
+         query indices of shape (E, n_way, n_query))
+    """
+    order = np.argsort(labels, kind="stable")
+    _, starts, counts = np.unique(labels[order], return_index=True, return_counts=True)
+    per_class = k_shot + n_query
+    eligible = np.flatnonzero(counts >= per_class)
+    if len(eligible) < n_way:
+        raise ValueError(
+            f"Need {n_way} classes with at least {per_class} images each, found {len(eligible)}"
+        )
+
+    # n_way distinct classes per episode: the smallest n_way of random keys
+    class_keys = rng.random((n_episodes, len(eligible)))
+    classes = eligible[np.argpartition(class_keys, n_way - 1, axis=1)[:, :n_way]]
+
+    # k_shot + n_query distinct members per class: a random permutation of the
+    # valid positions, with padding positions pushed to the end
+    max_count = counts[classes].max()
+    member_keys = rng.random((n_episodes, n_way, max_count))
+    member_keys[np.arange(max_count) >= counts[classes][..., None]] = np.inf
+    picks = np.argsort(member_keys, axis=-1)[..., :per_class]
+    members = order[starts[classes][..., None] + picks]
+    return members[..., :k_shot], members[..., k_shot:]
+
+
+def episode_accuracy(support_embeddings, query_embeddings, support, query):
+    """
+    Classify the queries of a chunk of episodes by their nearest prototype.
+
+    Parameters:
+    -----------
+    support_embeddings, query_embeddings : numpy.ndarray
+        (N, D) gallery embeddings used for the support set and the queries
+        (e.g. clean supports with attacked queries)
+    support, query : numpy.ndarray
+        Index arrays from ``sample_episodes``
+
+    Returns:
+    --------
+    numpy.ndarray
+        Query accuracy of each episode, shape (E,)
+    """
+    n_episodes, n_way, n_query = query.shape
+    prototypes = support_embeddings[support].mean(axis=2)
+    queries = query_embeddings[query].reshape(n_episodes, n_way * n_query, -1)
+
+    # Squared Euclidean distances, (E, n_way * n_query, n_way)
+    dists = (
+        np.einsum("eqd,eqd->eq", queries, queries)[..., None]
+        - 2 * queries @ prototypes.transpose(0, 2, 1)
+        + np.einsum("end,end->en", prototypes, prototypes)[:, None, :]
+    )
+    truth = np.repeat(np.arange(n_way), n_query)
+    return (dists.argmin(axis=-1) == truth).mean(axis=1)
+
+
+def mean_confidence_interval(values, confidence=0.95):
+    """Mean and normal-approximation confidence half-width of per-episode values."""
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    return float(np.mean(values)), float(z * np.std(values, ddof=1) / np.sqrt(len(values)))
+
+
+def evaluate_episodes(gallery, labels, embed_fn, n_way=5, k_shot=1, n_query=5,
+                      n_episodes=10000, attacks=(("FGSM", 5.0), ("PGD", 5.0)),
+                      seed=0, chunk_size=1000, confidence=0.95):
+    """
+    Run an episodic N-way K-shot evaluation for clean and attacked queries.
+
+    Supports are always clean; for each attack the whole gallery is attacked
+    once with ``apply_attack_batch`` and embedded once. All conditions are
+    scored on the same episodes.
+
+    Parameters:
+    -----------
+    gallery : numpy.ndarray
+        uint8 gallery images of shape (N, H, W) or (N, H, W, C)
+    labels : numpy.ndarray
+        Class label of each gallery image
+    embed_fn : callable
+        Maps a uint8 image batch to a (batch, D) array of embeddings
+    n_way, k_shot, n_query : int
+        Classes per episode, support and query images per class
+    n_episodes : int
+        Number of episodes to sample
+    attacks : sequence of tuple
+        (attack type, strength) pairs to evaluate besides the clean queries
+    seed : int
+        Seed for episode sampling and the attacks
+    chunk_size : int
+        Episodes sampled and scored per vectorized step, bounding memory use
+    confidence : float
+        Confidence level of the reported intervals
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per condition with mean accuracy and confidence interval
+    """
+    from attacks import apply_attack_batch
+
+    clean = embed_gallery(gallery, embed_fn)
+    conditions = {"Clean": clean}
+    for attack_type, strength in attacks:
+        attacked = apply_attack_batch(gallery, attack_type, strength, seed=seed)
+        conditions[f"{attack_type} ({strength:g})"] = embed_gallery(attacked, embed_fn)
+
+    rng = np.random.default_rng(seed)
+    accuracy = {name: [] for name in conditions}
+    for start in range(0, n_episodes, chunk_size):
+        support, query = sample_episodes(labels, min(chunk_size, n_episodes - start), n_way, k_shot, n_query, rng)
+        for name, query_embeddings in conditions.items():
+            accuracy[name].append(episode_accuracy(clean, query_embeddings, support, query))
+
+    rows = []
+    for name, chunks in accuracy.items():
+        mean, half_width = mean_confidence_interval(np.concatenate(chunks), confidence)
+        rows.append({
+            "Queries": name,
+            "Mean Accuracy": mean,
+            f"± {confidence:.0%} CI": half_width,
+            "CI Low": mean - half_width,
+            "CI High": mean + half_width,
+            "Episodes": n_episodes,
+        })
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Episodic N-way K-shot evaluation of the prototypical network.")
+    parser.add_argument("--data-dir", help="Gallery root with one sub-directory per class "
+                                           "(default: augmented bundled characters)")
+    parser.add_argument("--n-way", type=int, default=5)
+    parser.add_argument("--k-shot", type=int, default=1)
+    parser.add_argument("--n-query", type=int, default=5)
+    parser.add_argument("--episodes", type=int, default=10000)
+    parser.add_argument("--strength", type=float, default=5.0, help="FGSM/PGD attack strength")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from image_utils import load_gallery
+    from prototypical_page import embed_batch
+
+    if args.data_dir:
+        gallery, labels, _ = load_gallery(args.data_dir)
+    else:
+        gallery, labels, _ = build_sample_gallery(seed=args.seed)
+    results = evaluate_episodes(
+        gallery, labels, embed_batch, args.n_way, args.k_shot, args.n_query, args.episodes,
+        attacks=(("FGSM", args.strength), ("PGD", args.strength)), seed=args.seed,
+    )
+    print(results.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -4,20 +4,36 @@ Image Utility Functions Module
 This module provides utility functions for loading, processing, and analyzing images
 in the Falconnet demo application. It includes functionality for:
 - Loading sample character images from the assets directory
+- Decoding bulk uploads (individual files or zip archives) and galleries in parallel
 - Computing image differences and similarity metrics
+- Batched perturbation metrics (MSE, PSNR, SSIM, L∞, L2, L0)
+- Tiled, bounded-memory metrics for large images
 - Generating visualization heatmaps for attack analysis
 """
 
+import io
 import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
+import pandas as pd
 from PIL import Image
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 
+# SSIM stabilisation constants for 8-bit images (Wang et al., 2004)
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
 
+
+@lru_cache(maxsize=1)
 def load_sample_characters():
     """
     Load sample character images from the assets directory.
     
+    The images are decoded once per process and shared by every session;
+    callers must not modify them in place.
+    
     Returns:
     --------
     dict
@@ -34,6 +50,401 @@ def load_sample_characters():
     return char_images
 
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tif", ".tiff", ".webp")
+
+
+def expand_uploads(uploads):
+    """
+    Flatten uploaded files into (name, bytes) pairs, unpacking zip archives.
+    
+    Archive members are named ``archive.zip/member``, and repeated names get a
+    `` (2)``, `` (3)``, ... suffix, so every file keeps a unique name.
+    
+    Parameters:
+    -----------
+    uploads : list
+        File-like objects with a ``name`` attribute, e.g. Streamlit
+        ``UploadedFile`` objects
+    
+    Returns:
+    --------
+    list of tuple
+        (file name, raw bytes) for every image file, in upload order
+    """
+    files = []
+    seen = {}
+
+    def add(name, data):
+        seen[name] = seen.get(name, 0) + 1
+        files.append((name if seen[name] == 1 else f"{name} ({seen[name]})", data))
+
+    for upload in uploads:
+        data = upload.getvalue() if hasattr(upload, "getvalue") else upload.read()
+        if upload.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and member.filename.lower().endswith(IMAGE_EXTENSIONS):
+                        add(f"{upload.name}/{member.filename}", archive.read(member))
+        elif upload.name.lower().endswith(IMAGE_EXTENSIONS):
+            add(upload.name, data)
+    return files
+
+
+def _decode_image(data):
+    img = Image.open(io.BytesIO(data))
+    img.load()
+    return img.convert("RGB")
+
+
+def decode_images(files, max_workers=None):
+    """
+    Decode image bytes into RGB PIL images on a thread pool.
+    
+    Pillow releases the GIL while decoding, so the work runs in parallel.
+    Files that cannot be decoded are skipped; their names are the ones
+    missing from the result.
+    
+    Parameters:
+    -----------
+    files : list of tuple
+        (name, raw bytes) pairs, as returned by ``expand_uploads``
+    max_workers : int, optional
+        Size of the thread pool (defaults to the executor's own default)
+    
+    Returns:
+    --------
+    dict
+        Mapping of file name to PIL.Image, in input order
+    """
+    def decode(item):
+        name, data = item
+        try:
+            return name, _decode_image(data)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return name, None
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        decoded = list(pool.map(decode, files))
+    return {name: img for name, img in decoded if img is not None}
+
+
+def list_gallery(data_dir):
+    """
+    List gallery images and their class labels.
+    
+    Every directory that directly contains images is one class, so both
+    ``class/*.png`` and Omniglot's ``alphabet/character/*.png`` layouts work.
+    
+    Parameters:
+    -----------
+    data_dir : str
+        Root directory of the gallery
+    
+    Returns:
+    --------
+    tuple
+        (list of image paths, int32 array of class labels, list of class names)
+    """
+    paths, labels, class_names = [], [], []
+    for root, dirs, files in sorted(os.walk(data_dir)):
+        dirs.sort()
+        images = sorted(f for f in files if f.lower().endswith(IMAGE_EXTENSIONS))
+        if images:
+            class_names.append(os.path.relpath(root, data_dir))
+            paths.extend(os.path.join(root, f) for f in images)
+            labels.extend([len(class_names) - 1] * len(images))
+    return paths, np.array(labels, dtype=np.int32), class_names
+
+
+def load_gallery(data_dir, size=(28, 28), max_workers=None):
+    """
+    Load a class-per-directory gallery as a grayscale uint8 array.
+    
+    Images are decoded on a thread pool (see ``decode_images``) and resized
+    like the app's network preprocessing. Raises ValueError if none of them
+    can be decoded.
+    
+    Parameters:
+    -----------
+    data_dir : str
+        Root directory of the gallery (see ``list_gallery``)
+    size : tuple, optional
+        (width, height) every image is resized to
+    max_workers : int, optional
+        Size of the decoding thread pool
+    
+    Returns:
+    --------
+    tuple
+        (uint8 array of shape (N, height, width), int32 labels, list of class names)
+    """
+    paths, labels, class_names = list_gallery(data_dir)
+
+    def read(path):
+        with open(path, "rb") as f:
+            return path, f.read()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        images = decode_images(list(pool.map(read, paths)), max_workers)
+    if not images:
+        raise ValueError(f"No decodable images found in {data_dir}")
+    keep = np.array([path in images for path in paths], dtype=bool)
+    gallery = np.stack([np.asarray(images[path].convert("L").resize(size)) for path in paths if path in images])
+    return gallery, labels[keep], class_names
+
+
+def to_uint8_batch(images, batched=False):
+    """
+    Stack images into a single uint8 batch of shape (N, H, W, C).
+    
+    Values are not rescaled: float or wider integer arrays must be converted
+    to 0-255 uint8 by the caller.
+    
+    Parameters:
+    -----------
+    images : PIL.Image, list of PIL.Image or numpy.ndarray
+        A single image, a list of same-sized images, or a uint8 array of shape
+        (H, W), (H, W, C), (N, H, W, C) or, with ``batched``, (N, H, W).
+    batched : bool, optional
+        Whether a 3-D array is a batch of grayscale images (N, H, W) rather
+        than a single image with channels (H, W, C)
+    
+    Returns:
+    --------
+    numpy.ndarray
+        uint8 array of shape (N, H, W, C)
+    """
+    if isinstance(images, Image.Image):
+        images = [images]
+    if isinstance(images, np.ndarray):
+        batch = images
+        if batch.ndim == 2 or (batch.ndim == 3 and not batched):
+            batch = batch[np.newaxis]
+    else:
+        batch = np.stack([np.asarray(img) for img in images])
+    if batch.ndim == 3:
+        batch = batch[..., np.newaxis]
+    if batch.ndim != 4 or batch.shape[-1] not in (1, 3, 4):
+        raise ValueError(
+            f"Expected images with 1, 3 or 4 channels, got shape {np.shape(images)}; "
+            "pass batched=True for a batch of grayscale images"
+        )
+    if batch.dtype != np.uint8:
+        raise ValueError(f"Expected uint8 images, got {batch.dtype}; convert them to 0-255 uint8 first")
+    return batch
+
+
+def compute_difference(originals, adversarials, batched=False):
+    """
+    Compute the signed pixel difference between original and attacked images.
+    
+    The difference of two uint8 images always fits in int16, so this is the
+    only full-size array the metrics need; it is computed once and shared by
+    the metrics kernel and the heatmap.
+    
+    Parameters:
+    -----------
+    originals, adversarials : PIL.Image, list of PIL.Image or numpy.ndarray
+        Original and attacked images (see ``to_uint8_batch``). Must have the
+        same dimensions.
+    batched : bool, optional
+        Whether 3-D arrays are (N, H, W) batches (see ``to_uint8_batch``)
+    
+    Returns:
+    --------
+    numpy.ndarray
+        int16 array of shape (N, H, W, C) holding ``adversarial - original``
+    """
+    orig = to_uint8_batch(originals, batched)
+    adv = to_uint8_batch(adversarials, batched)
+    if orig.shape != adv.shape:
+        raise ValueError(f"Shape mismatch: {orig.shape} vs {adv.shape}")
+    return np.subtract(adv, orig, dtype=np.int16)
+
+
+def iter_tiles(height, width, tile_size):
+    """
+    Iterate over square tiles covering an image, in row-major order.
+    
+    Yields:
+    -------
+    tuple of slice
+        (row slice, column slice) for each tile; edge tiles may be smaller
+    """
+    for r0 in range(0, height, tile_size):
+        for c0 in range(0, width, tile_size):
+            yield slice(r0, min(r0 + tile_size, height)), slice(c0, min(c0 + tile_size, width))
+
+
+def _box_mean(arr, window):
+    """Mean over a sliding ``window`` x ``window`` box along the H and W axes."""
+    for axis in (1, 2):
+        n = arr.shape[axis] - window + 1
+        acc = np.zeros(arr.shape[:axis] + (n,) + arr.shape[axis + 1:], dtype=np.float32)
+        for k in range(window):
+            index = [slice(None)] * arr.ndim
+            index[axis] = slice(k, k + n)
+            acc += arr[tuple(index)]
+        arr = acc
+    return arr / np.float32(window * window)
+
+
+def _ssim_map(x, y, window):
+    """Per-window SSIM values for uint8 batches of shape (N, H, W, C)."""
+    x = x.astype(np.float32)
+    y = y.astype(np.float32)
+
+    mu_x = _box_mean(x, window)
+    mu_y = _box_mean(y, window)
+    var_x = _box_mean(x * x, window) - mu_x * mu_x
+    var_y = _box_mean(y * y, window) - mu_y * mu_y
+    cov_xy = _box_mean(x * y, window) - mu_x * mu_y
+
+    return ((2 * mu_x * mu_y + SSIM_C1) * (2 * cov_xy + SSIM_C2)) / (
+        (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    )
+
+
+def compute_ssim(originals, adversarials, window=7, batched=False):
+    """
+    Compute the windowed Structural Similarity Index for a batch of images.
+    
+    Local statistics use a uniform ``window`` x ``window`` box; the score is
+    averaged over all valid windows and channels.
+    
+    Parameters:
+    -----------
+    originals, adversarials : PIL.Image, list of PIL.Image or numpy.ndarray
+        Original and attacked images (see ``to_uint8_batch``)
+    window : int, optional
+        Side length of the sliding window. Clipped to the image size.
+    batched : bool, optional
+        Whether 3-D arrays are (N, H, W) batches (see ``to_uint8_batch``)
+    
+    Returns:
+    --------
+    numpy.ndarray
+        float32 array of shape (N,) with one SSIM score per image pair
+    """
+    x = to_uint8_batch(originals, batched)
+    y = to_uint8_batch(adversarials, batched)
+    window = max(1, min(window, x.shape[1], x.shape[2]))
+    ssim_map = _ssim_map(x, y, window)
+    return ssim_map.reshape(len(ssim_map), -1).mean(axis=1)
+
+
+def compute_perturbation_metrics(originals, adversarials, diff=None, window=7, batched=False):
+    """
+    Compute perturbation metrics for a batch of original/attacked image pairs.
+    
+    Every metric except SSIM is derived from a single int16 difference array,
+    so no float64 copies of the images are created.
+    
+    Parameters:
+    -----------
+    originals, adversarials : PIL.Image, list of PIL.Image or numpy.ndarray
+        Original and attacked images (see ``to_uint8_batch``)
+    diff : numpy.ndarray, optional
+        Precomputed output of ``compute_difference`` for the same pairs
+    window : int, optional
+        Sliding window size used for SSIM
+    batched : bool, optional
+        Whether 3-D arrays are (N, H, W) batches (see ``to_uint8_batch``)
+    
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per image pair with columns:
+        - MSE: Mean squared error in pixel units (0-255 scale)
+        - PSNR: Peak signal-to-noise ratio in dB (inf for identical images)
+        - SSIM: Structural similarity in [-1, 1]
+        - L∞: Largest absolute change, on the [0, 1] scale
+        - L2: Euclidean norm of the change, on the [0, 1] scale
+        - L0: Number of changed pixel values
+    """
+    if diff is None:
+        diff = compute_difference(originals, adversarials, batched)
+    flat = diff.reshape(len(diff), -1)
+
+    sse = np.einsum("ij,ij->i", flat, flat, dtype=np.int64)
+    mse = sse / flat.shape[1]
+    with np.errstate(divide="ignore"):
+        psnr = 10.0 * np.log10(255.0 ** 2 / mse)
+
+    return pd.DataFrame({
+        "MSE": mse,
+        "PSNR": psnr,
+        "SSIM": compute_ssim(originals, adversarials, window=window, batched=batched),
+        "L∞": np.abs(flat).max(axis=1) / 255.0,
+        "L2": np.sqrt(sse) / 255.0,
+        "L0": np.count_nonzero(flat, axis=1),
+    })
+
+
+def compute_perturbation_metrics_tiled(original, adversarial, tile_size=256, window=7):
+    """
+    Compute perturbation metrics for one large image pair, tile by tile.
+    
+    Produces the same table as ``compute_perturbation_metrics`` (SSIM up to
+    float rounding) while only holding one tile of intermediates at a time.
+    SSIM tiles are extended by ``window - 1`` pixels so that every sliding
+    window is evaluated exactly once.
+    
+    Parameters:
+    -----------
+    original, adversarial : PIL.Image or numpy.ndarray
+        The image pair, uint8 of shape (H, W) or (H, W, C). ``numpy.memmap``
+        arrays are read tile by tile.
+    tile_size : int, optional
+        Side length of the square tiles
+    window : int, optional
+        Sliding window size used for SSIM
+    
+    Returns:
+    --------
+    pandas.DataFrame
+        Single-row table with the columns of ``compute_perturbation_metrics``
+    """
+    orig = np.asarray(original)
+    adv = np.asarray(adversarial)
+    if orig.shape != adv.shape:
+        raise ValueError(f"Shape mismatch: {orig.shape} vs {adv.shape}")
+    if orig.ndim == 2:
+        orig, adv = orig[..., np.newaxis], adv[..., np.newaxis]
+    height, width = orig.shape[:2]
+    window = max(1, min(window, height, width))
+
+    sse = 0
+    max_abs = 0
+    nonzero = 0
+    for rows, cols in iter_tiles(height, width, tile_size):
+        diff = compute_difference(orig[rows, cols][np.newaxis], adv[rows, cols][np.newaxis]).ravel()
+        sse += int(np.dot(diff, diff.astype(np.int64)))
+        max_abs = max(max_abs, int(np.abs(diff).max()))
+        nonzero += int(np.count_nonzero(diff))
+
+    ssim_sum = 0.0
+    ssim_count = 0
+    for rows, cols in iter_tiles(height - window + 1, width - window + 1, tile_size):
+        halo = (slice(rows.start, rows.stop + window - 1), slice(cols.start, cols.stop + window - 1))
+        tile_map = _ssim_map(to_uint8_batch(orig[halo][np.newaxis]), to_uint8_batch(adv[halo][np.newaxis]), window)
+        ssim_sum += float(tile_map.sum(dtype=np.float64))
+        ssim_count += tile_map.size
+
+    mse = np.float64(sse) / orig.size
+    with np.errstate(divide="ignore"):
+        psnr = 10.0 * np.log10(255.0 ** 2 / mse)
+
+    return pd.DataFrame({
+        "MSE": [mse],
+        "PSNR": [psnr],
+        "SSIM": [ssim_sum / ssim_count],
+        "L∞": [max_abs / 255.0],
+        "L2": [np.sqrt(sse) / 255.0],
+        "L0": [nonzero],
+    })
+
+
 def compute_mse(img1, img2):
     """
     Compute Mean Squared Error between two images.
@@ -46,14 +457,13 @@ def compute_mse(img1, img2):
     Returns:
     --------
     float
-        Mean Squared Error between the two images, normalized to [0, 1] range
+        Mean Squared Error between the two images in pixel units (0-255 scale)
     """
-    arr1 = np.array(img1).astype(np.float32)
-    arr2 = np.array(img2).astype(np.float32)
-    return np.mean((arr1 - arr2) ** 2)
+    flat = compute_difference(img1, img2).ravel()
+    return float(np.dot(flat, flat.astype(np.int64)) / flat.size)
 
 
-def compute_difference_heatmap(img1, img2, small=False):
+def compute_difference_heatmap(img1, img2, small=False, diff=None):
     """
     Generate a heatmap visualization showing pixel-level differences between two images.
     
@@ -64,6 +474,9 @@ def compute_difference_heatmap(img1, img2, small=False):
     small : bool, optional
         If True, generate a smaller figure (3x3 inches)
         If False, generate a larger figure (5x5 inches)
+    diff : numpy.ndarray, optional
+        Precomputed difference of shape (H, W, C) or (1, H, W, C) from
+        ``compute_difference``; avoids recomputing it from the images
     
     Returns:
     --------
@@ -74,10 +487,13 @@ def compute_difference_heatmap(img1, img2, small=False):
         - White: High difference
         - Red: Extreme difference
     """
-    arr1 = np.array(img1).astype(np.float32)
-    arr2 = np.array(img2).astype(np.float32)
-    diff = np.abs(arr1 - arr2).mean(axis=2)
-    fig, ax = plt.subplots()
+    if diff is None:
+        diff = compute_difference(img1, img2)
+    diff = np.abs(diff.reshape(diff.shape[-3:])).mean(axis=2, dtype=np.float32)
+    # Created without pyplot, so it is never registered globally and can be
+    # built from any thread
+    fig = Figure()
+    ax = fig.subplots()
     if small:
         fig.set_size_inches(3, 3)  # Reduced size for smaller display
     else:
@@ -88,3 +504,10 @@ def compute_difference_heatmap(img1, img2, small=False):
     # Add color legend explanation
     fig.text(0.5, 0.01, "Color Legend: Black (No Change), Yellow (Moderate Change), White (High Change), Red (Extreme Change)", ha="center", fontsize=8)
     return fig
+
+
+def figure_to_png(fig, dpi=200):
+    """Render a Matplotlib figure to PNG bytes, cropped as ``st.pyplot`` does."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    return buffer.getvalue()
@@ -0,0 +1,455 @@
+"""
+Multi-Session Load Test
+---------------------
+This module starts the app with ``streamlit run`` and drives simulated users
+against that one server over Streamlit's websocket protocol, measuring how it
+behaves as concurrency grows.
+
+Every simulated session connects like a browser tab would and walks through
+the pages, picking characters, moving attack sliders, changing metric filters
+and switching Siamese phases. All sessions of a level share the server's
+caches and models, as real users do. Each level gets a fresh server, which
+first serves one untimed warm-up session (imports, model construction, cache
+fills); then all sessions connect together. For each concurrency level the
+harness reports:
+- Rerun latency percentiles per page, over successful reruns only
+- Throughput (successful reruns per second)
+- Error counts and error rate
+- CPU utilisation of the server process
+- Idle, peak and final RSS of the server process
+
+Usage:
+    python load_test.py --levels 1 2 4 8 16 32 64 --rounds 2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+import numpy as np
+import pandas as pd
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+PAGES = [
+    "Choose Character & Attack",
+    "Draw Character & Attack",
+    "Metrics & Visualizations",
+    "Siamese Network Visualization",
+    "Prototypical Network Visualization",
+]
+CHARACTERS = [f"Character {i}" for i in range(1, 6)]
+PERCENTILES = (50, 90, 99)
+# Session indices of the untimed warm-up passes start here
+WARMUP_SESSION = 1_000_000
+
+
+def free_port():
+    """An unused local TCP port."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, timeout=120):
+    """
+    Start ``streamlit run app.py`` headless on ``port`` and wait until it is healthy.
+
+    Returns:
+    --------
+    subprocess.Popen
+        The server process
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true",
+         "--server.address", "127.0.0.1", "--server.port", str(port),
+         "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"streamlit exited with code {server.returncode} before serving")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError(f"streamlit did not become healthy within {timeout} s")
+
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(10)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def process_rss(pid):
+    """Resident set size of process ``pid`` in bytes (0 once it has exited)."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def process_cpu(pid):
+    """User plus system CPU seconds consumed so far by process ``pid``."""
+    with open(f"/proc/{pid}/stat") as f:
+        # Fields after the parenthesised command name, which may contain spaces
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class ResourceSampler(threading.Thread):
+    """Background thread recording a process' RSS every ``interval`` seconds."""
+
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append(process_rss(self.pid))
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class SessionClient:
+    """
+    One browser-like websocket session against a running Streamlit server.
+
+    Like the frontend, it sends the state of every widget on the page with
+    each rerun, so values set earlier persist until the widget disappears.
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.widgets = {}  # id -> (type, widget proto) rendered by the last run
+        self.states = {}  # id -> WidgetState sent with the next rerun
+
+    def widget(self, label=None, key=None):
+        """The id and proto of the rendered widget with this label or user key."""
+        for widget_id, (_, proto) in self.widgets.items():
+            if (key is not None and widget_id.endswith(f"-{key}")) or (key is None and proto.label == label):
+                return widget_id, proto
+        raise KeyError(key or label)
+
+    def set_value(self, value, label=None, key=None):
+        """Set a selectbox, radio, multiselect or slider for the next rerun."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id, _ = self.widget(label, key)
+        state = WidgetState(id=widget_id)
+        kind = self.widgets[widget_id][0]
+        if kind == "slider":
+            state.double_array_value.data[:] = [value]
+        elif kind == "multiselect":
+            state.string_array_value.data[:] = value
+        else:
+            state.string_value = value
+        self.states[widget_id] = state
+
+    def click(self, label=None, key=None):
+        """Press a button on the next rerun."""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        widget_id, _ = self.widget(label, key)
+        self.states[widget_id] = WidgetState(id=widget_id, trigger_value=True)
+
+    async def rerun(self):
+        """
+        Rerun the script with the current widget states and wait for it to finish.
+
+        Returns:
+        --------
+        str or None
+            The first exception the script raised, or None
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ClientState_pb2 import ClientState
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetStates
+
+        message = BackMsg()
+        message.rerun_script.CopyFrom(ClientState(widget_states=WidgetStates(widgets=list(self.states.values()))))
+        await self.websocket.send(message.SerializeToString())
+
+        widgets, error = {}, None
+        while True:
+            reply = ForwardMsg()
+            reply.ParseFromString(await self.websocket.recv())
+            kind = reply.WhichOneof("type")
+            if kind == "delta" and reply.delta.WhichOneof("type") == "new_element":
+                element = reply.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "exception":
+                    error = error or element.exception.message
+                elif getattr(getattr(element, element_type), "id", ""):
+                    widgets[getattr(element, element_type).id] = (element_type, getattr(element, element_type))
+            elif kind == "script_finished":
+                if reply.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    # The script called st.rerun(); wait for the run that follows
+                    widgets = {}
+                    continue
+                if reply.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    error = error or "script failed to compile"
+                break
+
+        self.widgets = widgets
+        # Button presses last one run, and states of widgets that are gone are dropped
+        self.states = {widget_id: state for widget_id, state in self.states.items()
+                       if widget_id in widgets and state.WhichOneof("value") != "trigger_value"}
+        return error
+
+
+def page_actions(page, rng):
+    """
+    Interactions a user performs on a page, as (name, action) pairs.
+
+    Each action changes one widget of a ``SessionClient``; the caller reruns
+    the script after it.
+    """
+    strength = lambda: float(rng.integers(0, 11))
+    character = lambda: CHARACTERS[rng.integers(len(CHARACTERS))]
+    attack = lambda: ["FGSM", "PGD"][rng.integers(2)]
+
+    if page == "Choose Character & Attack":
+        return [
+            ("pick character", lambda s: s.set_value(character(), label="Choose one")),
+            ("choose attack", lambda s: s.set_value(attack(), label="Choose Attack Type")),
+            ("move strength", lambda s: s.set_value(strength(), label="Attack Strength")),
+            ("apply attack", lambda s: s.click(label="Apply Attack")),
+        ]
+    if page == "Draw Character & Attack":
+        # Strokes on the drawing canvas are not simulated
+        return [
+            ("choose attack", lambda s: s.set_value(attack(), label="Choose Attack Type")),
+            ("move strength", lambda s: s.set_value(strength(), label="Attack Strength")),
+        ]
+    if page == "Metrics & Visualizations":
+        def filter_models(s):
+            options = list(s.widget(label="Select Model")[1].options)
+            s.set_value(list(rng.choice(options, size=2, replace=False)), label="Select Model")
+
+        return [
+            ("filter models", filter_models),
+            ("filter network", lambda s: s.set_value(["Siamese"], label="Select Network")),
+        ]
+    if page == "Siamese Network Visualization":
+        def switch_phase(s):
+            phases = list(s.widget(label="Select Phase to Visualize")[1].options)
+            s.set_value(phases[rng.integers(len(phases))], label="Select Phase to Visualize")
+
+        return [
+            ("pick image A", lambda s: s.set_value(character(), key="image_a")),
+            ("pick image B", lambda s: s.set_value(character(), key="image_b")),
+            ("choose attack A", lambda s: s.set_value(attack(), key="attack_a")),
+            ("move strength A", lambda s: s.set_value(strength(), key="strength_a")),
+            ("switch phase", switch_phase),
+            ("switch phase", switch_phase),
+        ]
+    if page == "Prototypical Network Visualization":
+        return [
+            ("pick query", lambda s: s.set_value(character(), key="query_char")),
+            ("choose attack", lambda s: s.set_value(attack(), key="proto_attack")),
+            ("move strength", lambda s: s.set_value(strength(), key="proto_strength")),
+        ]
+    return []
+
+
+async def run_session(url, session, rounds=1, pages=PAGES, seed=0, timeout=300):
+    """
+    Simulate one user visiting ``pages`` ``rounds`` times over a websocket.
+
+    A rerun that times out or loses the connection ends the session, since
+    its replies can no longer be told apart from the next rerun's.
+
+    Returns:
+    --------
+    list of dict
+        One record per rerun: session, page, action, latency (s) and error
+    """
+    import websockets
+
+    rng = np.random.default_rng([seed, session])
+    records = []
+
+    async def timed(client, page, action):
+        start = time.perf_counter()
+        error = None
+        try:
+            error = await asyncio.wait_for(client.rerun(), timeout)
+        except Exception as exc:  # a timed-out or dropped rerun counts as an error
+            error = repr(exc)
+            raise
+        finally:
+            records.append({"Session": session, "Page": page, "Action": action,
+                            "Latency": time.perf_counter() - start, "Error": error})
+
+    try:
+        async with websockets.connect(url, subprotocols=["streamlit"], max_size=None,
+                                      ping_interval=None, open_timeout=timeout) as websocket:
+            client = SessionClient(websocket)
+            await timed(client, "Home", "open app")
+            for _ in range(rounds):
+                for page in pages:
+                    # Navigate with the sidebar radio, as a user would. Its id follows the
+                    # current page, so after a failed page the first click can target a
+                    # stale radio and bounce back; like a user, click once more then
+                    for _ in range(2):
+                        client.set_value(page, label="Go to")
+                        clicked = client.widget(label="Go to")[0]
+                        await timed(client, page, "open page")
+                        if clicked in client.widgets:
+                            break
+                    for action, apply in page_actions(page, rng):
+                        try:
+                            apply(client)
+                        except KeyError as exc:
+                            records.append({"Session": session, "Page": page, "Action": action,
+                                            "Latency": np.nan, "Error": f"widget not found: {exc!r}"})
+                            continue
+                        await timed(client, page, action)
+    except Exception as exc:
+        if not records or records[-1]["Error"] is None:
+            # Failed to connect rather than mid-rerun
+            records.append({"Session": session, "Page": "Home", "Action": "open app",
+                            "Latency": np.nan, "Error": repr(exc)})
+    return records
+
+
+async def _run_sessions(url, sessions, rounds, pages, seed):
+    results = await asyncio.gather(*(run_session(url, session, rounds, pages, seed) for session in sessions))
+    return [record for records in results for record in records]
+
+
+def run_level(concurrency, rounds=1, pages=PAGES, seed=0, warmup=True):
+    """
+    Start a server, run ``concurrency`` sessions against it at once and measure it.
+
+    Returns:
+    --------
+    tuple
+        (per-rerun records DataFrame, dict of level-wide measurements)
+    """
+    from memory_governor import MB
+
+    port = free_port()
+    url = f"ws://127.0.0.1:{port}/_stcore/stream"
+    server = start_server(port)
+    try:
+        if warmup:
+            # A session index that no level uses, so the warm-up takes its own random path
+            asyncio.run(_run_sessions(url, [WARMUP_SESSION + concurrency], 1, pages, seed))
+        idle_rss = process_rss(server.pid)
+        sampler = ResourceSampler(server.pid)
+        sampler.start()
+        cpu_start, start = process_cpu(server.pid), time.perf_counter()
+        records = pd.DataFrame(asyncio.run(_run_sessions(url, range(concurrency), rounds, pages, seed)))
+        wall = time.perf_counter() - start
+        cpu = process_cpu(server.pid) - cpu_start
+        final_rss = process_rss(server.pid)
+        sampler.stop()
+    finally:
+        stop_server(server)
+
+    failed = records["Error"].notna()
+    process = {
+        "Sessions": concurrency,
+        "Reruns": int((~failed).sum()),
+        "Errors": int(failed.sum()),
+        "Error rate (%)": 100 * failed.mean(),
+        "Wall (s)": wall,
+        "Throughput (reruns/s)": (~failed).sum() / wall,
+        "CPU (cores)": cpu / wall,
+        "Idle RSS (MB)": idle_rss / MB,
+        "Peak RSS (MB)": max(sampler.samples, default=final_rss) / MB,
+        "Final RSS (MB)": final_rss / MB,
+    }
+    return records, process
+
+
+def summarize_latency(records, percentiles=PERCENTILES):
+    """
+    Rerun latency percentiles (ms) per page, with rerun and error counts.
+
+    Latencies only include successful reruns; failed reruns and actions whose
+    widget was not found are counted as errors instead.
+    """
+    failed = records["Error"].notna()
+    grouped = records[~failed].groupby("Page", sort=False)["Latency"]
+    summary = pd.DataFrame({f"p{p} (ms)": grouped.quantile(p / 100) * 1000 for p in percentiles})
+    summary["Mean (ms)"] = grouped.mean() * 1000
+    summary["Reruns"] = grouped.size()
+    summary = summary.reindex(records["Page"].unique())
+    summary["Reruns"] = summary["Reruns"].fillna(0).astype(int)
+    summary["Errors"] = failed.groupby(records["Page"], sort=False).sum()
+    summary["Error rate (%)"] = 100 * failed.groupby(records["Page"], sort=False).mean()
+    return summary.rename_axis("Page").reset_index()
+
+
+def run_load_test(levels=(1, 2, 4, 8, 16, 32, 64), rounds=1, pages=PAGES, seed=0, warmup=True):
+    """
+    Run the load test at each concurrency level, each against a fresh server.
+
+    Unless ``warmup`` is False, every server serves one untimed session
+    first, so that imports, model construction and cache fills are not
+    attributed to the timed sessions.
+
+    Returns:
+    --------
+    tuple of pandas.DataFrame
+        (server measurements per level, latency percentiles per level and page)
+    """
+    logging.getLogger("websockets").setLevel(logging.ERROR)
+    processes, latencies = [], []
+    for concurrency in levels:
+        records, process = run_level(concurrency, rounds, pages, seed, warmup)
+        processes.append(process)
+        latencies.append(summarize_latency(records).assign(Sessions=concurrency))
+    latency = pd.concat(latencies, ignore_index=True)
+    return pd.DataFrame(processes), latency[["Sessions"] + [c for c in latency.columns if c != "Sessions"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the FALCONNet app with simulated sessions.")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="Numbers of concurrent websocket sessions to run against the server")
+    parser.add_argument("--rounds", type=int, default=1, help="Passes over the pages per session")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=PAGES, metavar="PAGE",
+                        help="Pages to visit (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Directory to write process.csv and latency.csv to")
+    args = parser.parse_args()
+
+    process, latency = run_load_test(args.levels, args.rounds, args.pages, args.seed)
+    with pd.option_context("display.width", 200, "display.float_format", "{:.1f}".format):
+        print(process.to_string(index=False))
+        print()
+        print(latency.to_string(index=False))
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+        process.to_csv(os.path.join(args.output, "process.csv"), index=False)
+        latency.to_csv(os.path.join(args.output, "latency.csv"), index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""
+Memory Governance Module
+----------------------
+This module keeps the app's memory bounded when many users are connected:
+- Session-scoped objects (uploaded images, attack results) are stored in a
+  process-wide governor instead of ``st.session_state``, with their sizes tracked
+- Per-session and process-wide byte budgets are enforced by evicting the least
+  recently used objects; sessions idle for too long are dropped entirely
+- A session's most recently used object is exempt from the per-session budget
+  (only process-wide pressure evicts it), and evicted keys are remembered so
+  pages can tell the user to re-run
+- Matplotlib figures are closed as soon as they have been rendered
+- Shared resources (models, sample images) are accounted for process-wide
+- Current usage is shown in the sidebar
+
+Budgets are configured with environment variables:
+- FALCONNET_SESSION_MEMORY_MB: per-session budget (default 64)
+- FALCONNET_PROCESS_MEMORY_MB: budget for all sessions together (default 1024)
+- FALCONNET_SESSION_TTL_S: idle time after which a session's objects are dropped (default 1800)
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+KINDS = ("images", "figures", "models")
+MB = 1024 * 1024
+
+
+def estimate_nbytes(obj):
+    """
+    Estimate the memory held by an object.
+
+    Understands PIL images, NumPy arrays, bytes, pandas objects, Matplotlib
+    figures, Keras models and (nested) dicts, lists and tuples of those.
+    """
+    from PIL import Image
+
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, Image.Image):
+        return obj.width * obj.height * len(obj.getbands())
+    if isinstance(obj, dict):
+        return sum(estimate_nbytes(value) for value in obj.values())
+    if isinstance(obj, (list, tuple)):
+        return sum(estimate_nbytes(value) for value in obj)
+    if hasattr(obj, "memory_usage"):  # pandas DataFrame / Series
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(obj, "get_size_inches") and hasattr(obj, "dpi"):  # Matplotlib figure (RGBA canvas)
+        width, height = obj.get_size_inches() * obj.dpi
+        return int(width * height * 4)
+    if hasattr(obj, "count_params"):  # Keras model (float32 weights)
+        return int(obj.count_params()) * 4
+    return 0
+
+
+def process_rss():
+    """Current resident set size of this process in bytes (peak RSS where unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class MemoryGovernor:
+    """
+    Owns session-scoped objects and enforces memory budgets by LRU eviction.
+
+    Entries live in one ordered map per session (least recently used first).
+    ``shared`` entries (process-wide resources such as models) are accounted
+    for but never evicted. Keys evicted to meet a budget are kept in
+    ``evicted`` until they are stored or popped again.
+    """
+
+    def __init__(self, session_budget=64 * MB, process_budget=1024 * MB, session_ttl=1800.0):
+        self.session_budget = session_budget
+        self.process_budget = process_budget
+        self.session_ttl = session_ttl
+        self.sessions = {}
+        self.last_seen = {}
+        self.shared = {}
+        self.evicted = {}  # session id -> keys evicted to meet a budget
+        self.evictions = 0
+        self._lock = threading.RLock()
+
+    def put(self, session_id, key, value, kind="images", nbytes=None, on_evict=None):
+        """Store ``value`` for a session, replacing any previous entry, and enforce budgets."""
+        size = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            entries = self.sessions.setdefault(session_id, OrderedDict())
+            self._release(entries.pop(key, None))
+            entries[key] = (value, kind, size, on_evict)
+            self.evicted.get(session_id, set()).discard(key)
+            self.last_seen[session_id] = time.monotonic()
+            self.enforce(protect=(session_id, key))
+
+    def get(self, session_id, key, default=None):
+        """Return a session's entry (marking it recently used), or ``default`` if evicted."""
+        with self._lock:
+            self.last_seen[session_id] = time.monotonic()
+            entries = self.sessions.get(session_id)
+            if not entries or key not in entries:
+                return default
+            entries.move_to_end(key)
+            return entries[key][0]
+
+    def pop(self, session_id, key):
+        with self._lock:
+            entries = self.sessions.get(session_id, {})
+            self._release(entries.pop(key, None))
+            self.evicted.get(session_id, set()).discard(key)
+
+    def drop_session(self, session_id):
+        with self._lock:
+            for entry in self.sessions.pop(session_id, {}).values():
+                self._release(entry)
+            self.last_seen.pop(session_id, None)
+            self.evicted.pop(session_id, None)
+
+    def was_evicted(self, session_id, key):
+        """Whether a session's entry was evicted to meet a budget (rather than popped)."""
+        with self._lock:
+            return key in self.evicted.get(session_id, ())
+
+    def track(self, key, value, kind="models", nbytes=None):
+        """Account for a shared, process-wide resource that is never evicted."""
+        size = estimate_nbytes(value) if nbytes is None else nbytes
+        with self._lock:
+            self.shared[key] = (kind, size)
+
+    def usage(self, session_id=None):
+        """
+        Tracked bytes per kind, for one session or (by default) the whole process.
+
+        Returns:
+        --------
+        dict
+            {"images": ..., "figures": ..., "models": ..., "total": ...}
+        """
+        totals = dict.fromkeys(KINDS, 0)
+        with self._lock:
+            sessions = [self.sessions.get(session_id, {})] if session_id is not None else self.sessions.values()
+            for entries in sessions:
+                for _, kind, size, _ in entries.values():
+                    totals[kind] = totals.get(kind, 0) + size
+            if session_id is None:
+                for kind, size in self.shared.values():
+                    totals[kind] = totals.get(kind, 0) + size
+        totals["total"] = sum(totals.values())
+        return totals
+
+    def enforce(self, protect=None):
+        """
+        Apply the TTL and budgets, evicting least recently used entries first.
+
+        ``protect`` is a (session id, key) pair that is never evicted, so an
+        object that was just stored is returned even if it exceeds the budget.
+        Each session's most recently used entry is also exempt from the
+        per-session budget, so a single large result survives later reruns;
+        it is only evicted under process-wide pressure.
+        """
+        with self._lock:
+            now = time.monotonic()
+            for session_id, seen in list(self.last_seen.items()):
+                if now - seen > self.session_ttl:
+                    self.drop_session(session_id)
+
+            for session_id, entries in self.sessions.items():
+                if not entries:
+                    continue
+                latest = (session_id, next(reversed(entries)))
+                self._evict(lambda: sum(e[2] for e in entries.values()) > self.session_budget,
+                            [(session_id, entries)], {protect, latest})
+
+            # Process-wide: evict from the least recently active sessions first
+            order = sorted(self.sessions.items(), key=lambda item: self.last_seen.get(item[0], 0))
+            session_bytes = lambda: sum(e[2] for entries in self.sessions.values() for e in entries.values())
+            self._evict(lambda: session_bytes() > self.process_budget, order, {protect})
+
+    def _evict(self, over_budget, sessions, protect):
+        for session_id, entries in sessions:
+            for key in list(entries):
+                if not over_budget():
+                    return
+                if (session_id, key) not in protect:
+                    self._release(entries.pop(key))
+                    self.evicted.setdefault(session_id, set()).add(key)
+                    self.evictions += 1
+
+    @staticmethod
+    def _release(entry):
+        if entry is None:
+            return
+        value, kind, _, on_evict = entry
+        if on_evict is not None:
+            on_evict(value)
+        elif kind == "figures":
+            import matplotlib.pyplot as plt
+
+            plt.close(value)
+
+
+@st.cache_resource
+def get_governor():
+    """The process-wide governor, configured from the environment."""
+    return MemoryGovernor(
+        session_budget=float(os.environ.get("FALCONNET_SESSION_MEMORY_MB", 64)) * MB,
+        process_budget=float(os.environ.get("FALCONNET_PROCESS_MEMORY_MB", 1024)) * MB,
+        session_ttl=float(os.environ.get("FALCONNET_SESSION_TTL_S", 1800)),
+    )
+
+
+def current_session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "bare"
+
+
+def session_put(key, value, kind="images"):
+    """Store a session-scoped object under the governor's budgets."""
+    get_governor().put(current_session_id(), key, value, kind)
+
+
+def session_get(key, default=None):
+    """Fetch a session-scoped object; returns ``default`` if it was evicted."""
+    return get_governor().get(current_session_id(), key, default)
+
+
+def session_pop(key):
+    get_governor().pop(current_session_id(), key)
+
+
+def session_evicted(key):
+    """Whether a session-scoped object was dropped by the governor to free memory."""
+    return get_governor().was_evicted(current_session_id(), key)
+
+
+def show_figure(fig, **kwargs):
+    """Render a Matplotlib figure and close it right away so it is not kept by pyplot."""
+    import matplotlib.pyplot as plt
+
+    st.pyplot(fig, **kwargs)
+    plt.close(fig)
+
+
+def render_memory_sidebar():
+    """Show process and session memory usage in the sidebar."""
+    import matplotlib.pyplot as plt
+
+    governor = get_governor()
+    governor.enforce()
+    process = governor.usage()
+    session = governor.usage(current_session_id())
+
+    with st.sidebar.expander("🧠 Memory", expanded=False):
+        st.metric("Process RSS", f"{process_rss() / MB:.0f} MB")
+        st.caption(
+            f"Tracked: {process['total'] / MB:.1f} / {governor.process_budget / MB:.0f} MB "
+            f"across {len(governor.sessions)} sessions · evictions: {governor.evictions}"
+        )
+        st.caption(f"This session: {session['total'] / MB:.1f} / {governor.session_budget / MB:.0f} MB")
+        st.dataframe(
+            {
+                "Kind": list(KINDS),
+                "Session (MB)": [round(session[kind] / MB, 2) for kind in KINDS],
+                "Process (MB)": [round(process[kind] / MB, 2) for kind in KINDS],
+            },
+            hide_index=True,
+        )
+        st.caption(f"Open Matplotlib figures: {len(plt.get_fignums())}")
@@ -1,55 +1,10 @@
 import streamlit as st
+from results_store import RESULTS_STORE
 
-def metrics_visualization_page():
+@st.cache_data
+def load_metrics_table():
+    """Evaluation results for every network, evaluation type and model variant."""
     import pandas as pd
-    import matplotlib.pyplot as plt
-
-    st.title("📊 Metrics & Visualizations")
-
-    st.markdown("""
-    <style>
-    .metrics-info {
-        background: #f7fafd;
-        border-radius: 10px;
-        border: 1px solid #e3e8ee;
-        padding: 18px 10px 10px 10px;
-        margin-bottom: 18px;
-        font-family: 'Fira Mono', 'Consolas', monospace;
-        font-size: 15px;
-        color: #222;
-        overflow-x: auto;
-    }
-    </style>
-    <div class="metrics-info">
-        <b>Performance Analysis Dashboard:</b><br>
-        1. <b>Model Comparison</b>: Compare Siamese vs Prototypical Networks.<br>
-        2. <b>Attack Resistance</b>: Analyze model performance under different attacks.<br>
-        3. <b>Interactive Filtering</b>: Filter results by network type and evaluation mode.<br>
-        4. <b>Visual Analytics</b>: Multiple visualizations of model performance metrics.<br>
-    </div>
-    """, unsafe_allow_html=True)
-
-    st.markdown(
-        "> **How to use this dashboard:**\n"
-        "> - Use the filters to focus on specific networks or evaluation types.\n"
-        "> - Compare performance metrics across different model variants.\n"
-        "> - Analyze the impact of different attacks on model accuracy.\n"
-        "> - Explore detailed visualizations of model behavior.\n"
-    )
-
-    # Performance Metrics Section
-    st.header("💫 Performance Comparison")
-    st.markdown("""
-        This section presents a detailed comparison between Siamese and Prototypical Networks,
-        evaluating their performance under different conditions:
-        - Base model performance
-        - Adversarial Training (AT) impact
-        - Data Diversification (DD) effects
-        - Combined AT+DD effectiveness
-    """)
-
-    # Metrics Table
-    st.header("Performance Comparison of Siamese and Prototypical Networks")
 
     data = {
         "Network": ["Siamese"] * 8 + ["Prototypical"] * 8,
@@ -74,7 +29,21 @@ def metrics_visualization_page():
         ]
     }
 
-    df = pd.DataFrame(data)
+    return pd.DataFrame(data)
+
+@st.cache_data
+def load_metrics_rollup(store_dir=RESULTS_STORE):
+    """Rollup of the per-sample results store, or of the bundled summary table if there is none."""
+    from results_store import has_store, load_rollup, summary_rollup
+
+    if has_store(store_dir):
+        return load_rollup(store_dir)
+    return summary_rollup(load_metrics_table())
+
+@st.fragment
+def filtered_metrics_fragment(rollup, store_dir=RESULTS_STORE):
+    """Filters, table and charts; reruns on its own when a filter changes."""
+    from results_store import accuracy_by, count_samples, filter_rollup, has_store, read_samples
 
     # Add filters in a single row above the table
     st.markdown("---")
@@ -82,55 +51,197 @@ def metrics_visualization_page():
     col1, col2, col3 = st.columns(3)
 
     with col1:
-        network_filter = st.multiselect("Select Network", options=df["Network"].unique(), default=df["Network"].unique())
+        network_filter = st.multiselect("Select Network", options=rollup["Network"].unique(), default=rollup["Network"].unique())
     with col2:
-        eval_type_filter = st.multiselect("Select Evaluation Type", options=df["Eval. Type"].unique(), default=df["Eval. Type"].unique())
+        eval_type_filter = st.multiselect("Select Evaluation Type", options=rollup["Eval. Type"].unique(), default=rollup["Eval. Type"].unique())
     with col3:
-        model_filter = st.multiselect("Select Model", options=df["Model"].unique(), default=df["Model"].unique())
-
-    filtered_df = df[
-        (df["Network"].isin(network_filter)) &
-        (df["Eval. Type"].isin(eval_type_filter)) &
-        (df["Model"].isin(model_filter))
-    ]
-
-    st.dataframe(filtered_df)
-
-    # Visualizations
+        model_filter = st.multiselect("Select Model", options=rollup["Model"].unique(), default=rollup["Model"].unique())
+    filters = {"Network": network_filter, "Eval. Type": eval_type_filter, "Model": model_filter}
+
+    # Attack strengths, when the results were logged per epsilon
+    epsilons = sorted(e for e in rollup["Epsilon"].dropna().unique() if e > 0)
+    if len(epsilons) > 1:
+        epsilon_filter = st.multiselect("Select Attack Epsilon", options=epsilons, default=epsilons)
+        filters["Epsilon"] = [0.0] + epsilon_filter
+
+    filtered = filter_rollup(rollup, filters)
+    if filtered.empty:
+        st.info("No results match the selected filters.")
+        return
+    st.dataframe(accuracy_by(filtered, ["Network", "Eval. Type", "Model"]), hide_index=True)
+
+    # Visualizations, re-aggregated from the filtered rollup. Plain Vega-Lite
+    # specs are used because building them through Altair dominates the rerun
     st.header("Visualizations")
+    by_network = accuracy_by(filtered, ["Network"])
+
+    def bar_spec(column, color):
+        return {
+            "mark": {"type": "bar", "color": color},
+            "encoding": {
+                "x": {"field": "Network", "type": "nominal", "axis": {"labelAngle": 0}},
+                "y": {"field": column, "type": "quantitative", "title": "Accuracy", "scale": {"domain": [0, 1]}},
+            },
+            "height": 220,
+        }
 
     # Two-column layout for the first two graphs
     col4, col5 = st.columns(2)
     with col4:
         st.subheader("Average No Attack Accuracy by Network")
-        fig, ax = plt.subplots(figsize=(3, 2))  # Smaller size
-        df.groupby("Network")["No Attack Accuracy"].mean().plot(kind="bar", ax=ax, color=["blue", "orange"])
-        ax.set_ylabel("Accuracy")
-        st.pyplot(fig)
+        st.vega_lite_chart(by_network, bar_spec("No Attack Accuracy", "#1f77b4"), use_container_width=True)
 
     with col5:
         st.subheader("Impact of Attacks on Accuracy")
-        fig, ax = plt.subplots(figsize=(3, 2))  # Smaller size
-        for model in df["Model"].unique():
-            subset = df[df["Model"] == model]
-            ax.plot(["No Attack", "PGD Attack", "FGSM Attack"], subset.iloc[0, 3:6], label=model)
-        ax.set_ylabel("Accuracy")
-        ax.set_yticks([0.0, 0.2, 0.4, 0.6, 0.8, 1.0])  # Adjusted y-axis for 0 to 1 range
-        ax.legend(fontsize="small", loc="upper right")  # Smaller legend
-        st.pyplot(fig)
+        by_model = accuracy_by(filtered, ["Model"]).melt(id_vars="Model", var_name="Attack", value_name="Accuracy")
+        by_model["Attack"] = by_model["Attack"].str.replace(" Accuracy", "")
+        st.vega_lite_chart(by_model, {
+            "mark": {"type": "line", "point": True},
+            "encoding": {
+                "x": {"field": "Attack", "type": "nominal", "sort": None, "axis": {"labelAngle": 0}},
+                "y": {"field": "Accuracy", "type": "quantitative", "scale": {"domain": [0, 1]}},
+                "color": {"field": "Model", "type": "nominal"},
+            },
+            "height": 220,
+        }, use_container_width=True)
 
     # Additional graphs for PGD and FGSM attack accuracy
     col6, col7 = st.columns(2)
     with col6:
         st.subheader("Average PGD Attack Accuracy by Network")
-        fig, ax = plt.subplots(figsize=(3, 2))  # Smaller size
-        df.groupby("Network")["PGD Attack Accuracy"].mean().plot(kind="bar", ax=ax, color=["green", "red"])
-        ax.set_ylabel("Accuracy")
-        st.pyplot(fig)
+        st.vega_lite_chart(by_network, bar_spec("PGD Attack Accuracy", "#2ca02c"), use_container_width=True)
 
     with col7:
         st.subheader("Average FGSM Attack Accuracy by Network")
-        fig, ax = plt.subplots(figsize=(3, 2))  # Smaller size
-        df.groupby("Network")["FGSM Attack Accuracy"].mean().plot(kind="bar", ax=ax, color=["purple", "cyan"])
-        ax.set_ylabel("Accuracy")
-        st.pyplot(fig)
\ No newline at end of file
+        st.vega_lite_chart(by_network, bar_spec("FGSM Attack Accuracy", "#9467bd"), use_container_width=True)
+
+    # Per-sample records, read from the store with the filters pushed down
+    if has_store(store_dir) and st.toggle("Show per-sample records"):
+        samples = read_samples(store_dir, filters, limit=1000)
+        expected, found = int(filtered["Samples"].sum()), count_samples(store_dir, filters)
+        st.caption(f"{found:,} matching samples (showing up to 1,000)")
+        if found != expected:
+            st.warning(
+                f"The per-sample records ({found:,}) do not match the rollup ({expected:,}); "
+                "rebuild the store with results_store.py."
+            )
+        st.dataframe(samples, hide_index=True)
+
+@st.cache_data
+def load_stored_calibration(store_dir=RESULTS_STORE):
+    """Verification calibration written by calibration.py, or None if there is none."""
+    from calibration import has_calibration, load_calibration
+
+    return load_calibration(store_dir) if has_calibration(store_dir) else None
+
+def verification_calibration_section():
+    """ROC curves, EER and the calibrated threshold of the Siamese network's pair scores."""
+    from calibration import SUMMARY_WEIGHTS_COLUMNS, near_chance
+
+    st.markdown("---")
+    st.header("Siamese Verification Calibration")
+    st.markdown(
+        "> **How well does the similarity score separate same-class from different-class pairs?**\n"
+        "> - Every labelled gallery pair is scored; the threshold is chosen on clean pairs (maximising TPR - FPR).\n"
+        "> - Under attack, one image of each pair is attacked and the clean threshold is kept.\n"
+    )
+    stored = load_stored_calibration()
+    if stored is None:
+        st.info(
+            "No verification calibration has been stored yet. Compute one for your weights with "
+            "`python calibration.py --weights checkpoints/siamese.npz --store results_store`."
+        )
+        return
+    summary, curves = stored
+    if "Weights Hash" in summary:
+        st.caption(f"Calibrated with `{summary['Weights'].iloc[0]}` (weights hash `{summary['Weights Hash'].iloc[0]}`)")
+    summary = summary.drop(columns=SUMMARY_WEIGHTS_COLUMNS, errors="ignore")
+    if near_chance(summary["AUC"].iloc[0]):
+        st.warning(
+            f"The clean AUC is {summary['AUC'].iloc[0]:.3f}, about chance: these weights do not separate "
+            "same from different characters, so the threshold below is not a meaningful decision boundary."
+        )
+    st.dataframe(summary, hide_index=True, column_config={
+        column: st.column_config.NumberColumn(format="%.4f")
+        for column in ["AUC", "EER", "EER Threshold", "Threshold", "TPR", "FPR"]
+    })
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("ROC Curves")
+        st.vega_lite_chart(curves, {
+            "mark": {"type": "line"},
+            "encoding": {
+                "x": {"field": "FPR", "type": "quantitative", "title": "False Positive Rate", "scale": {"domain": [0, 1]}},
+                "y": {"field": "TPR", "type": "quantitative", "title": "True Positive Rate", "scale": {"domain": [0, 1]}},
+                "color": {"field": "Condition", "type": "nominal", "sort": None},
+                # Both rates grow along a ROC curve, so this orders the points exactly
+                "order": [{"field": "FPR", "type": "quantitative"}, {"field": "TPR", "type": "quantitative"}],
+            },
+            "height": 260,
+        }, use_container_width=True)
+
+    with col2:
+        st.subheader("Equal Error Rate by Condition")
+        st.vega_lite_chart(summary, {
+            "mark": {"type": "bar", "color": "#d62728"},
+            "encoding": {
+                "x": {"field": "Condition", "type": "nominal", "sort": None, "axis": {"labelAngle": 0}},
+                "y": {"field": "EER", "type": "quantitative", "title": "EER", "scale": {"domain": [0, 1]}},
+            },
+            "height": 260,
+        }, use_container_width=True)
+
+def metrics_visualization_page():
+    st.title("📊 Metrics & Visualizations")
+
+    st.markdown("""
+    <style>
+    .metrics-info {
+        background: #f7fafd;
+        border-radius: 10px;
+        border: 1px solid #e3e8ee;
+        padding: 18px 10px 10px 10px;
+        margin-bottom: 18px;
+        font-family: 'Fira Mono', 'Consolas', monospace;
+        font-size: 15px;
+        color: #222;
+        overflow-x: auto;
+    }
+    </style>
+    <div class="metrics-info">
+        <b>Performance Analysis Dashboard:</b><br>
+        1. <b>Model Comparison</b>: Compare Siamese vs Prototypical Networks.<br>
+        2. <b>Attack Resistance</b>: Analyze model performance under different attacks.<br>
+        3. <b>Interactive Filtering</b>: Filter results by network type and evaluation mode.<br>
+        4. <b>Visual Analytics</b>: Multiple visualizations of model performance metrics.<br>
+    </div>
+    """, unsafe_allow_html=True)
+
+    st.markdown(
+        "> **How to use this dashboard:**\n"
+        "> - Use the filters to focus on specific networks or evaluation types.\n"
+        "> - Compare performance metrics across different model variants.\n"
+        "> - Analyze the impact of different attacks on model accuracy.\n"
+        "> - Explore detailed visualizations of model behavior.\n"
+    )
+
+    # Performance Metrics Section
+    st.header("💫 Performance Comparison")
+    st.markdown("""
+        This section presents a detailed comparison between Siamese and Prototypical Networks,
+        evaluating their performance under different conditions:
+        - Base model performance
+        - Adversarial Training (AT) impact
+        - Data Diversification (DD) effects
+        - Combined AT+DD effectiveness
+    """)
+
+    # Metrics Table
+    st.header("Performance Comparison of Siamese and Prototypical Networks")
+
+    rollup = load_metrics_rollup()
+
+    filtered_metrics_fragment(rollup)
+
+    verification_calibration_section()
@@ -0,0 +1,254 @@
+"""
+NumPy Siamese Inference Engine
+----------------------------
+This module runs the Siamese network's forward pass with NumPy only, so the
+app can serve it without importing TensorFlow:
+- Weights are exported once from the Keras model to a ``.npz`` file
+- Convolutions use im2col: a strided sliding-window view of the padded input
+  is flattened into patches and multiplied with the kernel in one matmul
+- Every ``vis_*`` intermediate is produced, along with embeddings and pair
+  similarity scores for whole batches
+
+Outputs match Keras to within 1e-5.
+
+Usage:
+    python numpy_siamese.py --export --weights checkpoints/siamese_at.weights.h5 --output checkpoints/siamese.npz
+    python numpy_siamese.py --check
+"""
+
+import argparse
+import hashlib
+import os
+
+import numpy as np
+
+# Keras layer names whose kernels and biases make up the exported weights
+WEIGHT_LAYERS = ["conv1", "conv2", "dense", "similarity"]
+# Keras' LeakyReLU default
+NEGATIVE_SLOPE = 0.3
+
+
+def export_weights(model, path=None):
+    """
+    Extract the Siamese network's weights, optionally saving them to ``path``.
+
+    Parameters:
+    -----------
+    model : keras.Model
+        Model built by ``siamese_page.build_siamese_network``
+    path : str, optional
+        ``.npz`` file to write
+
+    Returns:
+    --------
+    dict
+        {"<layer>_kernel": ..., "<layer>_bias": ...} float32 arrays
+    """
+    weights = {}
+    for name in WEIGHT_LAYERS:
+        kernel, bias = model.get_layer(name).get_weights()
+        weights[f"{name}_kernel"] = np.asarray(kernel, dtype=np.float32)
+        weights[f"{name}_bias"] = np.asarray(bias, dtype=np.float32)
+    if path is not None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(path, **weights)
+    return weights
+
+
+def load_weights(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def weights_fingerprint(weights):
+    """Content hash of exported weights, the same whichever file or model they came from."""
+    digest = hashlib.blake2b(digest_size=8)
+    for name in sorted(weights):
+        array = np.ascontiguousarray(weights[name], dtype=np.float32)
+        digest.update(f"{name}{array.shape}".encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def conv2d_same(x, kernel, bias):
+    """
+    Stride-1 'same' convolution of an NHWC batch via im2col.
+
+    Parameters:
+    -----------
+    x : numpy.ndarray
+        float32 input of shape (N, H, W, C)
+    kernel : numpy.ndarray
+        (KH, KW, C, F) kernel in Keras layout
+    bias : numpy.ndarray
+        (F,) bias
+
+    Returns:
+    --------
+    numpy.ndarray
+        float32 output of shape (N, H, W, F)
+    """
+    n, h, w, c = x.shape
+    kh, kw, _, f = kernel.shape
+    top, left = (kh - 1) // 2, (kw - 1) // 2
+    padded = np.pad(x, ((0, 0), (top, kh - 1 - top), (left, kw - 1 - left), (0, 0)))
+    # (N, H, W, C, KH, KW) view without copying; the reshape builds the patch matrix
+    patches = np.lib.stride_tricks.sliding_window_view(padded, (kh, kw), axis=(1, 2))
+    columns = patches.reshape(n * h * w, c * kh * kw)
+    weights = kernel.transpose(2, 0, 1, 3).reshape(c * kh * kw, f)
+    return (columns @ weights + bias).reshape(n, h, w, f)
+
+
+def leaky_relu(x, negative_slope=NEGATIVE_SLOPE):
+    # max(x, a * x) equals the leaky ReLU for 0 <= a <= 1, without a mask
+    return np.maximum(x, x * np.float32(negative_slope))
+
+
+def max_pool_2x2(x):
+    """2x2 max pooling with stride 2 ('valid' padding) of an NHWC batch."""
+    n, h, w, c = x.shape
+    h, w = h // 2, w // 2
+    return x[:, :2 * h, :2 * w].reshape(n, h, 2, w, 2, c).max(axis=(2, 4))
+
+
+def sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+
+class SiameseEngine:
+    """
+    NumPy forward pass of the Siamese network.
+
+    Parameters:
+    -----------
+    weights : dict or str
+        Weights from ``export_weights`` or the path of a ``.npz`` export
+    """
+
+    def __init__(self, weights):
+        if isinstance(weights, str):
+            weights = load_weights(weights)
+        self.weights = {name: np.asarray(value, dtype=np.float32) for name, value in weights.items()}
+
+    def layer_outputs(self, batch):
+        """
+        Run a batch through the shared network, keeping every intermediate.
+
+        Parameters:
+        -----------
+        batch : numpy.ndarray
+            float32 images in [0, 1] of shape (N, 28, 28, 1)
+
+        Returns:
+        --------
+        dict
+            {"vis_conv1": ..., ..., "vis_dense": ...} with the same names and
+            shapes as the Keras visualization network's outputs
+        """
+        w = self.weights
+        x = np.asarray(batch, dtype=np.float32)
+        outputs = {}
+        outputs["vis_conv1"] = x = conv2d_same(x, w["conv1_kernel"], w["conv1_bias"])
+        outputs["vis_leaky1"] = x = leaky_relu(x)
+        outputs["vis_pool1"] = x = max_pool_2x2(x)
+        outputs["vis_conv2"] = x = conv2d_same(x, w["conv2_kernel"], w["conv2_bias"])
+        outputs["vis_leaky2"] = x = leaky_relu(x)
+        outputs["vis_pool2"] = x = max_pool_2x2(x)
+        outputs["vis_flatten"] = x = x.reshape(len(x), -1)
+        outputs["vis_dense"] = np.maximum(x @ w["dense_kernel"] + w["dense_bias"], 0)
+        return outputs
+
+    def embed(self, batch):
+        """Embeddings (the ``vis_dense`` output) of a batch, shape (N, 8)."""
+        return self.layer_outputs(batch)["vis_dense"]
+
+    def score_embeddings(self, embeddings_a, embeddings_b):
+        """Similarity scores of paired embeddings, shape (N,)."""
+        w = self.weights
+        return sigmoid(np.abs(embeddings_a - embeddings_b) @ w["similarity_kernel"] + w["similarity_bias"])[:, 0]
+
+    def score(self, batch_a, batch_b, batch_size=1024):
+        """
+        Similarity scores for pairs of images, in batches.
+
+        Parameters:
+        -----------
+        batch_a, batch_b : numpy.ndarray
+            float32 images of shape (N, 28, 28, 1); row i of each forms a pair
+        batch_size : int
+            Pairs per forward pass, bounding memory use
+
+        Returns:
+        --------
+        numpy.ndarray
+            float32 scores of shape (N,)
+        """
+        scores = [
+            self.score_embeddings(self.embed(batch_a[i:i + batch_size]), self.embed(batch_b[i:i + batch_size]))
+            for i in range(0, len(batch_a), batch_size)
+        ]
+        return np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+
+
+def check_against_keras(n_images=64, seed=0, weights_path=None):
+    """
+    Compare the engine with Keras on random inputs.
+
+    Returns:
+    --------
+    dict
+        Largest absolute difference per output (layers and pair scores)
+    """
+    from keras.models import Model
+    from siamese_page import VISUALIZATION_PHASES, build_siamese_network, build_visualization_network
+
+    siamese = build_siamese_network()
+    if weights_path:
+        siamese.load_weights(weights_path)
+    vis_model = build_visualization_network()
+    for name in ["conv1", "conv2", "dense"]:
+        vis_model.get_layer(f"vis_{name}").set_weights(siamese.get_layer(name).get_weights())
+
+    rng = np.random.default_rng(seed)
+    batch_a = rng.random((n_images, 28, 28, 1), dtype=np.float32)
+    batch_b = rng.random((n_images, 28, 28, 1), dtype=np.float32)
+    engine = SiameseEngine(export_weights(siamese))
+
+    names = [name for name, _, _ in VISUALIZATION_PHASES]
+    layer_model = Model(vis_model.input, [vis_model.get_layer(name).output for name in names])
+    keras_outputs = layer_model(batch_a, training=False)
+    outputs = engine.layer_outputs(batch_a)
+    differences = {
+        name: float(np.abs(np.asarray(expected) - outputs[name]).max())
+        for name, expected in zip(names, keras_outputs)
+    }
+    keras_scores = np.asarray(siamese([batch_a, batch_b], training=False))[:, 0]
+    differences["score"] = float(np.abs(keras_scores - engine.score(batch_a, batch_b)).max())
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NumPy inference engine for the FALCONNet Siamese network.")
+    parser.add_argument("--export", action="store_true", help="Export Keras weights to a .npz file")
+    parser.add_argument("--check", action="store_true", help="Compare the engine's outputs with Keras")
+    parser.add_argument("--weights", help="Keras weights (.weights.h5); random initialisation if omitted")
+    parser.add_argument("--output", default=os.path.join("checkpoints", "siamese.npz"), help="Export path")
+    args = parser.parse_args()
+
+    if args.export:
+        from siamese_page import build_siamese_network
+
+        model = build_siamese_network()
+        if args.weights:
+            model.load_weights(args.weights)
+        export_weights(model, args.output)
+        print(f"Exported weights to {args.output}")
+    if args.check:
+        for name, difference in check_against_keras(weights_path=args.weights).items():
+            print(f"{name:12s} max |Δ| = {difference:.2e}")
+    if not (args.export or args.check):
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,33 @@
 import streamlit as st
 
+def embed_batch(images):
+    """
+    Mock embedding of a uint8 batch of 28x28 grayscale images (replace with real model in production).
+
+    Returns the first 32 normalised pixels of each image, as ``embed`` does for a single image.
+    """
+    import numpy as np
+
+    return np.asarray(images, dtype=np.float32).reshape(len(images), -1)[:, :32] / 255.0
+
+@st.cache_data(max_entries=16)
+def run_episodic_evaluation(n_way, k_shot, n_query, n_episodes, strength, seed=0):
+    from episodic_evaluation import build_sample_gallery, evaluate_episodes
+
+    gallery, labels, _ = build_sample_gallery(seed=seed)
+    return evaluate_episodes(
+        gallery, labels, embed_batch, n_way, k_shot, n_query, n_episodes,
+        attacks=(("FGSM", strength), ("PGD", strength)), seed=seed,
+    )
+
 def prototypical_network_page():
     import numpy as np
     from PIL import Image
     from image_utils import load_sample_characters
-    from attacks import apply_attack
+    from speculation import STRENGTH_STEP, cached_result, speculate_neighbours
     import matplotlib.pyplot as plt
     from sklearn.decomposition import PCA
+    from memory_governor import show_figure
 
     st.title("🌐 Prototypical Network Visualization")
 
@@ -67,8 +88,8 @@ def prototypical_network_page():
         st.markdown("---")
         st.subheader("Attack Configuration (Optional)")
         attack_type = st.selectbox("Attack Type", ["None", "FGSM", "PGD"], key="proto_attack")
-        attack_strength = st.slider("Attack Strength", 0.0, 10.0, 0.0, key="proto_strength")
-        attacked_query = apply_attack(query_image, attack_type, attack_strength) if attack_type != "None" and attack_strength > 0 else query_image
+        attack_strength = st.slider("Attack Strength", 0.0, 10.0, 0.0, step=STRENGTH_STEP, key="proto_strength")
+        attacked_query = cached_result("attack", query_image, attack_type, attack_strength)
     with col2:
         # Only show one image: attacked if attack, else original
         st.image(attacked_query, caption="Query Image", use_container_width=True)
@@ -79,8 +100,8 @@ def prototypical_network_page():
     with left:
         # Mock embedding function (replace with real model in production)
         def embed(img):
-            arr = np.array(img.convert("L").resize((28, 28))).astype(np.float32).flatten() / 255.0
-            return arr[:32]  # 32-dim mock embedding
+            arr = np.array(img.convert("L").resize((28, 28)))
+            return embed_batch(arr[np.newaxis])[0]  # 32-dim mock embedding
 
         support_embeddings = []
         support_labels = []
@@ -111,7 +132,7 @@ def prototypical_network_page():
         # Place legend below the plot, smaller font
         ax.legend(loc='lower center', bbox_to_anchor=(0.5, -0.25), fontsize=7, ncol=3, frameon=False)
         ax.set_title("Embedding Space", fontsize=10)
-        st.pyplot(fig)
+        show_figure(fig)
     with right:
         # Calculate distances between query and each prototype
         dists = [np.linalg.norm(embed(characters[support_selection[char]]) - query_emb) for char in char_names]
@@ -127,6 +148,28 @@ def prototypical_network_page():
         st.table(dist_table)
         st.success(f"**Predicted Class:** {pred_class}")
 
+    # Precompute the attacked query for the neighbouring slider settings
+    speculate_neighbours("prototypical", "attack", query_image, attack_type, attack_strength)
+
+    st.markdown("---")
+    st.header("4️⃣ Episodic Evaluation")
+    st.markdown(
+        "> Evaluate the embedding on many random N-way K-shot episodes drawn from an augmented gallery "
+        "of the sample characters. Each gallery image is embedded once and reused across all episodes."
+    )
+    col3, col4, col5, col6 = st.columns(4)
+    with col3:
+        n_way = st.slider("N-way", 2, len(char_names), len(char_names), key="episodic_n_way")
+    with col4:
+        k_shot = st.slider("K-shot", 1, 10, 1, key="episodic_k_shot")
+    with col5:
+        n_episodes = st.select_slider("Episodes", [100, 1000, 5000, 10000], value=1000, key="episodic_episodes")
+    with col6:
+        episodic_strength = st.slider("Query Attack Strength", 0.0, 10.0, 5.0, key="episodic_strength")
+    if st.button("Run Episodic Evaluation"):
+        results = run_episodic_evaluation(n_way, k_shot, 5, n_episodes, episodic_strength)
+        st.dataframe(results, hide_index=True, use_container_width=True)
+
     st.markdown("---")
     st.header("ℹ️ About Prototypical Networks")
     st.markdown(
@@ -0,0 +1,276 @@
+"""
+Evaluation Results Store
+----------------------
+This module backs the metrics dashboard with a columnar store of per-sample
+evaluation logs (one row per model x attack x epsilon x sample):
+- ``samples/``: the raw log as a Parquet dataset, hive-partitioned by network
+  and attack so filters prune whole files
+- ``rollup.parquet``: pre-aggregated sample and correct counts per network,
+  evaluation type, model, attack and epsilon
+
+Rollups hold additive counts rather than accuracies, so any filtered or
+coarser view can be re-aggregated from them exactly without touching the
+per-sample log.
+
+Usage:
+    python results_store.py --log per_sample_log.parquet --store results_store
+    python results_store.py --synthetic 100000 --store results_store
+"""
+
+import argparse
+import os
+import shutil
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Store read by the app; the metrics dashboard falls back to its bundled
+# summary table when it does not exist
+RESULTS_STORE = os.environ.get("FALCONNET_RESULTS_STORE", "results_store")
+DIMENSIONS = ["Network", "Eval. Type", "Model", "Attack", "Epsilon"]
+PARTITIONS = ["Network", "Attack"]
+# Small row groups let min/max statistics skip most of a file for non-partition filters
+ROWS_PER_GROUP = 64 * 1024
+ATTACK_COLUMNS = {
+    "None": "No Attack Accuracy",
+    "PGD": "PGD Attack Accuracy",
+    "FGSM": "FGSM Attack Accuracy",
+}
+
+
+def rollup_samples(samples):
+    """
+    Aggregate per-sample rows into sample and correct counts per dimension.
+
+    Parameters:
+    -----------
+    samples : pandas.DataFrame
+        Per-sample log with the ``DIMENSIONS`` columns and a boolean ``Correct``
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per dimension combination with ``Samples`` and ``Correct`` counts
+    """
+    grouped = samples.groupby(DIMENSIONS, dropna=False, observed=True, sort=False)["Correct"]
+    return pd.DataFrame({"Samples": grouped.size(), "Correct": grouped.sum()}).reset_index()
+
+
+def summary_rollup(summary):
+    """
+    Express a table of accuracies (one row per network, evaluation type and
+    model, one column per attack) as a rollup with one sample per cell.
+    """
+    rollup = summary.melt(
+        id_vars=["Network", "Eval. Type", "Model"],
+        value_vars=list(ATTACK_COLUMNS.values()),
+        var_name="Attack", value_name="Correct",
+    )
+    rollup["Attack"] = rollup["Attack"].map({column: attack for attack, column in ATTACK_COLUMNS.items()})
+    rollup["Epsilon"] = np.nan
+    rollup["Samples"] = 1
+    return rollup[DIMENSIONS + ["Samples", "Correct"]]
+
+
+def build_store(log_path, store_dir, batch_size=1_000_000):
+    """
+    Convert a per-sample log into a partitioned Parquet store plus rollup.
+
+    The log is streamed in record batches, so it never has to fit in memory.
+
+    Parameters:
+    -----------
+    log_path : str
+        Per-sample log (Parquet or CSV) with the ``DIMENSIONS`` columns and a
+        boolean ``Correct`` column
+    store_dir : str
+        Output directory
+    batch_size : int
+        Rows per streamed record batch
+
+    Returns:
+    --------
+    pandas.DataFrame
+        The rollup written to ``rollup.parquet``
+    """
+    import pyarrow.dataset as ds
+
+    source = ds.dataset(log_path, format="csv" if log_path.lower().endswith(".csv") else "parquet")
+    partial = []
+    # Partitions of a previous log would otherwise survive next to the new ones
+    shutil.rmtree(os.path.join(store_dir, "samples"), ignore_errors=True)
+
+    def batches():
+        for batch in source.to_batches(batch_size=batch_size):
+            partial.append(rollup_samples(batch.to_pandas()))
+            yield batch
+
+    ds.write_dataset(
+        batches(), os.path.join(store_dir, "samples"), schema=source.schema, format="parquet",
+        partitioning=PARTITIONS, partitioning_flavor="hive", existing_data_behavior="overwrite_or_ignore",
+        min_rows_per_group=ROWS_PER_GROUP, max_rows_per_group=ROWS_PER_GROUP,
+    )
+    rollup = (
+        pd.concat(partial)
+        .groupby(DIMENSIONS, dropna=False, observed=True)[["Samples", "Correct"]].sum()
+        .reset_index()
+    )
+    rollup.to_parquet(os.path.join(store_dir, "rollup.parquet"), index=False)
+    _open_samples.cache_clear()
+    return rollup
+
+
+def has_store(store_dir):
+    return os.path.exists(os.path.join(store_dir, "rollup.parquet"))
+
+
+def load_rollup(store_dir):
+    return pd.read_parquet(os.path.join(store_dir, "rollup.parquet"))
+
+
+def filter_rollup(rollup, filters):
+    """Keep rollup rows whose values are selected in ``filters`` ({column: values})."""
+    mask = np.ones(len(rollup), dtype=bool)
+    for column, values in filters.items():
+        mask &= rollup[column].isin(values).to_numpy()
+    return rollup[mask]
+
+
+def accuracy_by(rollup, by):
+    """
+    Accuracy per attack, grouped by ``by`` and re-aggregated from counts.
+
+    Returns:
+    --------
+    pandas.DataFrame
+        One row per group with one accuracy column per attack (``ATTACK_COLUMNS``)
+    """
+    counts = rollup.groupby(by + ["Attack"], observed=True, sort=False)[["Samples", "Correct"]].sum()
+    accuracy = (counts["Correct"] / counts["Samples"]).unstack("Attack")
+    accuracy = accuracy.reindex(columns=[a for a in ATTACK_COLUMNS if a in accuracy.columns])
+    return accuracy.rename(columns=ATTACK_COLUMNS).reset_index().rename_axis(columns=None)
+
+
+@lru_cache(maxsize=8)
+def _open_samples(store_dir):
+    """Discover the per-sample dataset once per process (file listing and schema)."""
+    import pyarrow.dataset as ds
+
+    return ds.dataset(os.path.join(store_dir, "samples"), format="parquet", partitioning="hive")
+
+
+def _filter_expression(filters):
+    """
+    Combine {column: selected values} into a dataset filter expression.
+
+    Float values are matched with OR'd ``==`` comparisons: ``isin`` prunes
+    row groups whose statistics are min=-0.0 / max=0.0, dropping every clean
+    (epsilon 0) sample.
+    """
+    import pyarrow.dataset as ds
+
+    expression = None
+    for column, values in filters.items():
+        values = list(values)
+        if any(isinstance(value, (float, np.floating)) for value in values):
+            condition = ds.scalar(False)
+            for value in values:
+                condition = condition | (ds.field(column) == float(value))
+        else:
+            condition = ds.field(column).isin(values)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def count_samples(store_dir, filters):
+    """Number of per-sample rows matching ``filters``; equals the filtered rollup's ``Samples`` sum."""
+    return _open_samples(store_dir).count_rows(filter=_filter_expression(filters))
+
+
+def read_samples(store_dir, filters, columns=None, limit=None):
+    """
+    Read per-sample rows with the filters pushed down to the Parquet scan.
+
+    Partition columns prune whole files; the other filters are evaluated
+    against row-group statistics and then row by row.
+
+    Parameters:
+    -----------
+    store_dir : str
+        Store directory written by ``build_store``
+    filters : dict
+        {column: selected values}
+    columns : list of str, optional
+        Columns to read
+    limit : int, optional
+        Maximum number of rows to return
+
+    Returns:
+    --------
+    pandas.DataFrame
+        Matching rows
+    """
+    import pyarrow.dataset as ds
+
+    samples = _open_samples(store_dir)
+    expression = _filter_expression(filters)
+    if limit is None:
+        return samples.to_table(columns=columns, filter=expression).to_pandas()
+    # Read lazily, one fragment and batch at a time, so head() stops early
+    scanner = samples.scanner(
+        columns=columns, filter=expression, batch_size=4096, fragment_readahead=1, batch_readahead=1,
+        fragment_scan_options=ds.ParquetFragmentScanOptions(pre_buffer=False),
+    )
+    return scanner.head(limit).to_pandas()
+
+
+def synthesize_log(summary, n_samples, epsilons=(2.0, 5.0, 8.0), seed=0):
+    """
+    Generate a synthetic per-sample log consistent with a summary table.
+
+    Each (network, evaluation type, model) gets ``n_samples`` clean samples
+    and ``n_samples`` per attack and epsilon; attacked accuracy falls linearly
+    from the clean accuracy and equals the summary value at epsilon 5.
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for values in summary.to_dict("records"):
+        clean = values[ATTACK_COLUMNS["None"]]
+        settings = [("None", 0.0, clean)] + [
+            (attack, eps, float(np.clip(clean - (clean - values[ATTACK_COLUMNS[attack]]) * eps / 5.0, 0, 1)))
+            for attack in ("PGD", "FGSM") for eps in epsilons
+        ]
+        for attack, eps, accuracy in settings:
+            frames.append(pd.DataFrame({
+                "Network": values["Network"], "Eval. Type": values["Eval. Type"], "Model": values["Model"],
+                "Attack": attack, "Epsilon": eps, "Sample": np.arange(n_samples, dtype=np.int64),
+                "Correct": rng.random(n_samples) < accuracy,
+            }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FALCONNet evaluation results store.")
+    parser.add_argument("--store", default="results_store", help="Output store directory")
+    parser.add_argument("--log", help="Per-sample log (Parquet or CSV) to ingest")
+    parser.add_argument("--synthetic", type=int, help="Instead of --log, synthesize this many samples "
+                                                      "per model, attack and epsilon")
+    args = parser.parse_args()
+
+    log_path = args.log
+    if log_path is None:
+        if not args.synthetic:
+            parser.error("one of --log or --synthetic is required")
+        from metrics_page import load_metrics_table
+
+        os.makedirs(args.store, exist_ok=True)
+        log_path = os.path.join(args.store, "synthetic_log.parquet")
+        synthesize_log(load_metrics_table(), args.synthetic).to_parquet(log_path, index=False)
+
+    rollup = build_store(log_path, args.store)
+    print(f"Stored {int(rollup['Samples'].sum())} samples in {args.store} ({len(rollup)} rollup rows)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,148 @@
 import streamlit as st
 
+# Images above this many pixels are attacked tile by tile instead of batched
+LARGE_IMAGE_PIXELS = 2048 * 2048
+# Pixels attacked and measured per batch, bounding the float intermediates
+BATCH_PIXELS = LARGE_IMAGE_PIXELS
+THUMBNAILS_PER_PAGE = 12
+THUMBNAIL_SIZE = (128, 128)
 
-def select_character_attack_page():
+
+def run_bulk_attack(images, attack_type, attack_strength):
+    """
+    Attack every uploaded image and compute its perturbation metrics.
+    
+    Images of the same size are attacked and measured in batches of up to
+    ``BATCH_PIXELS`` pixels; very large images go through the tiled,
+    bounded-memory path instead.
+    
+    Returns:
+    --------
+    tuple
+        (results DataFrame with one row per image, dict of attacked uint8 arrays)
+    """
+    import numpy as np
+    import pandas as pd
+    from attacks import apply_attack_batch, apply_attack_tiled
+    from image_utils import compute_perturbation_metrics, compute_perturbation_metrics_tiled
+
+    groups = {}
+    for name, img in images.items():
+        groups.setdefault(img.size, []).append(name)
+
+    tables = []
+    attacked = {}
+    for (width, height), names in groups.items():
+        if width * height > LARGE_IMAGE_PIXELS:
+            for name in names:
+                original = np.asarray(images[name])
+                attacked[name] = apply_attack_tiled(original, attack_type, attack_strength)
+                tables.append(compute_perturbation_metrics_tiled(original, attacked[name]).assign(Image=name))
+        else:
+            per_batch = max(1, BATCH_PIXELS // (width * height))
+            for start in range(0, len(names), per_batch):
+                chunk = names[start:start + per_batch]
+                batch = np.stack([np.asarray(images[name]) for name in chunk])
+                attacked_batch = apply_attack_batch(batch, attack_type, attack_strength)
+                tables.append(compute_perturbation_metrics(batch, attacked_batch).assign(Image=chunk))
+                attacked.update(zip(chunk, attacked_batch))
+
+    results = pd.concat(tables).set_index("Image").loc[list(images)].reset_index()
+    results.insert(1, "Size", [f"{images[name].width}×{images[name].height}" for name in results["Image"]])
+    return results, attacked
+
+
+@st.fragment
+def bulk_results_fragment(results, images, attacked):
+    """Sortable results table, paged thumbnails and on-demand detail view."""
+    import numpy as np
     from PIL import Image
-    from attacks import apply_attack
-    from image_utils import compute_mse, compute_difference_heatmap, load_sample_characters
+    from image_utils import compute_difference, compute_difference_heatmap
+    from memory_governor import show_figure
+
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        sort_by = st.selectbox("Sort by", results.columns, index=list(results.columns).index("MSE"))
+    with col2:
+        ascending = st.toggle("Ascending", value=False)
+    results = results.sort_values(sort_by, ascending=ascending, ignore_index=True)
+
+    st.caption("Select a row to inspect the image and its difference heatmap.")
+    event = st.dataframe(
+        results, hide_index=True, use_container_width=True,
+        on_select="rerun", selection_mode="single-row",
+    )
+
+    # Only the thumbnails of the current page are generated
+    st.subheader("Attacked Thumbnails")
+    n_pages = max(1, -(-len(results) // THUMBNAILS_PER_PAGE))
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1) if n_pages > 1 else 1
+    page_rows = results.iloc[(page - 1) * THUMBNAILS_PER_PAGE:page * THUMBNAILS_PER_PAGE]
+    cols = st.columns(6)
+    for i, (name, mse) in enumerate(zip(page_rows["Image"], page_rows["MSE"])):
+        thumb = Image.fromarray(attacked[name])
+        thumb.thumbnail(THUMBNAIL_SIZE)
+        with cols[i % 6]:
+            st.image(thumb, caption=f"{name} (MSE {mse:.2f})")
+
+    if event.selection.rows:
+        name = results["Image"].iloc[event.selection.rows[0]]
+        st.markdown(f"### {name}")
+        col3, col4, col5 = st.columns(3)
+        with col3:
+            st.image(images[name], caption="Original", use_container_width=True)
+        with col4:
+            st.image(attacked[name], caption="Attacked", use_container_width=True)
+        with col5:
+            diff = compute_difference(np.asarray(images[name]), attacked[name])
+            show_figure(compute_difference_heatmap(None, None, small=True, diff=diff))
+
+
+def bulk_attack_section():
+    from image_utils import expand_uploads, decode_images
+    from memory_governor import session_evicted, session_get, session_pop, session_put
+
+    st.header("📦 Bulk Upload")
+    uploads = st.file_uploader(
+        "Upload images or a zip archive",
+        type=["png", "jpg", "jpeg", "bmp", "gif", "tif", "tiff", "webp", "zip"],
+        accept_multiple_files=True,
+    )
+
+    st.markdown("---")
+    st.header("⚔️ Attack Configuration")
+    attack_type = st.selectbox("Choose Attack Type", ["FGSM", "PGD"], key="bulk_attack_type")
+    attack_strength = st.slider("Attack Strength", 0.0, 10.0, 5.0, key="bulk_attack_strength")
+
+    run_key = (tuple(upload.file_id for upload in uploads), attack_type, attack_strength)
+    if uploads and st.button("Apply Attack to All"):
+        with st.spinner("Decoding and attacking images..."):
+            files = expand_uploads(uploads)
+            images = decode_images(files)
+            failed = [name for name, _ in files if name not in images]
+            if failed:
+                st.warning(f"Skipped {len(failed)} file(s) that could not be decoded: {', '.join(failed)}")
+            if images:
+                results, attacked = run_bulk_attack(images, attack_type, attack_strength)
+                session_put("bulk_results", (run_key, results, images, attacked))
+            else:
+                session_pop("bulk_results")
+                st.warning("No decodable images were found in the upload.")
+
+    # Held by the memory governor, so it may have been evicted under memory pressure
+    stored = session_get("bulk_results")
+    if stored is None and session_evicted("bulk_results"):
+        st.warning("The bulk results were dropped to free memory; click **Apply Attack to All** to re-run.")
+    elif stored is not None and stored[0] == run_key:
+        _, results, images, attacked = stored
+        st.markdown("---")
+        st.header(f"📊 Results for {len(results)} Images")
+        bulk_results_fragment(results, images, attacked)
+
+
+def select_character_attack_page():
+    from image_utils import load_sample_characters
+    from speculation import STRENGTH_STEP, cached_result, speculate_neighbours
 
     st.title("📂 Choose Character & Attack Playground")
 
@@ -37,8 +175,14 @@ def select_character_attack_page():
         "> - Configure and apply adversarial attacks.\n"
         "> - Compare the original and attacked versions.\n"
         "> - Analyze the attack impact using visual tools.\n"
+        "> - Switch to **Bulk Upload** to attack many of your own images at once.\n"
     )
 
+    mode = st.radio("Mode", ["Single Character", "Bulk Upload"], horizontal=True)
+    if mode == "Bulk Upload":
+        bulk_attack_section()
+        return
+
     characters = load_sample_characters()
     char_names = list(characters.keys())
 
@@ -68,10 +212,12 @@ def select_character_attack_page():
     attack_type = st.selectbox(
         "Choose Attack Type", ["FGSM", "PGD"]
     )
-    attack_strength = st.slider("Attack Strength", 0.0, 10.0, 5.0)  # Adjusted range to 0-10
+    attack_strength = st.slider("Attack Strength", 0.0, 10.0, 5.0, step=STRENGTH_STEP)  # Adjusted range to 0-10
 
     if st.button("Apply Attack"):
-        attacked_image = apply_attack(selected_image, attack_type, attack_strength)
+        # Attack, metrics and heatmap, usually precomputed by the previous run
+        analysis = cached_result("analysis", selected_image, attack_type, attack_strength)
+        attacked_image = analysis["attacked"]
 
         st.markdown("### Original vs Attacked Image")
         col3, col4 = st.columns([1, 1])
@@ -101,16 +247,21 @@ def select_character_attack_page():
             """<div class="pixel-analysis">
             <b>Pixel-Level Analysis</b> provides insights into how the attack has altered the image.<br>
             - <b>MSE (Mean Squared Error):</b> Measures the average squared difference between the original and attacked images.<br>
+            - <b>PSNR / SSIM:</b> Signal-to-noise ratio and structural similarity of the attacked image.<br>
+            - <b>L∞ / L2 / L0:</b> Largest change, overall size of the change, and number of changed pixel values.<br>
             - <b>Heatmap:</b> Highlights the regions most affected by the attack.
             </div>""",
             unsafe_allow_html=True
         )
 
-        mse = compute_mse(selected_image, attacked_image)
+        metrics = analysis["metrics"]
+        mse = metrics["MSE"].iloc[0]
         st.markdown(
             f"<h5 style='text-align: center;'>MSE: {mse:.2f}</h5>",
             unsafe_allow_html=True,
         )
+        st.dataframe(metrics, hide_index=True, use_container_width=True)
+
+        st.image(analysis["heatmap"], use_container_width=True)
 
-        fig = compute_difference_heatmap(selected_image, attacked_image, small=True)
-        st.pyplot(fig)
+        speculate_neighbours("select", "analysis", selected_image, attack_type, attack_strength)
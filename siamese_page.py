@@ -1,23 +1,35 @@
+import os
 import streamlit as st
 
+# Trained weights written by adversarial_training.py; the networks keep their
+# random initialisation when the file does not exist
+SIAMESE_WEIGHTS = os.environ.get("FALCONNET_SIAMESE_WEIGHTS", os.path.join("checkpoints", "siamese_at.weights.h5"))
+# NumPy export of the same weights (numpy_siamese.py --export); lets the NumPy
+# backend run without importing TensorFlow
+SIAMESE_NPZ = os.environ.get("FALCONNET_SIAMESE_NPZ", os.path.join("checkpoints", "siamese.npz"))
+BACKENDS = ["Keras", "NumPy"]
+# Matched case-insensitively; unknown values fall back to Keras with a warning on the page
+REQUESTED_BACKEND = os.environ.get("FALCONNET_SIAMESE_BACKEND", "Keras")
+DEFAULT_BACKEND = next((b for b in BACKENDS if b.lower() == REQUESTED_BACKEND.strip().lower()), None)
+
 def build_siamese_network():
     from keras.models import Model
     from keras.layers import Input, Conv2D, MaxPooling2D, Flatten, Dense, Lambda, LeakyReLU
-    from keras import backend as K
+    from keras import ops
 
     input_shape = (28, 28, 1)
     input_a = Input(shape=input_shape, name="Input_A")
     input_b = Input(shape=input_shape, name="Input_B")
 
-    # Create shared layers
-    conv1 = Conv2D(8, (3, 3), padding='same')
-    leaky1 = LeakyReLU()
-    pool1 = MaxPooling2D((2, 2))
-    conv2 = Conv2D(16, (3, 3), padding='same')
-    leaky2 = LeakyReLU()
-    pool2 = MaxPooling2D((2, 2))
-    flatten = Flatten()
-    dense = Dense(8, activation='relu')
+    # Create shared layers (named so weights can be copied to the visualization network)
+    conv1 = Conv2D(8, (3, 3), padding='same', name='conv1')
+    leaky1 = LeakyReLU(name='leaky1')
+    pool1 = MaxPooling2D((2, 2), name='pool1')
+    conv2 = Conv2D(16, (3, 3), padding='same', name='conv2')
+    leaky2 = LeakyReLU(name='leaky2')
+    pool2 = MaxPooling2D((2, 2), name='pool2')
+    flatten = Flatten(name='flatten')
+    dense = Dense(8, activation='relu', name='dense')
 
     def shared_network(input_layer):
         x = conv1(input_layer)
@@ -34,8 +46,8 @@ def build_siamese_network():
     processed_a = shared_network(input_a)
     processed_b = shared_network(input_b)
 
-    l1_distance = Lambda(lambda tensors: K.abs(tensors[0] - tensors[1]))([processed_a, processed_b])
-    output = Dense(1, activation='sigmoid')(l1_distance)
+    l1_distance = Lambda(lambda tensors: ops.abs(tensors[0] - tensors[1]), output_shape=(8,), name='l1_distance')([processed_a, processed_b])
+    output = Dense(1, activation='sigmoid', name='similarity')(l1_distance)
 
     model = Model(inputs=[input_a, input_b], outputs=output)
     return model
@@ -60,13 +72,215 @@ def build_visualization_network():
     model = Model(inputs=input_layer, outputs=x, name='visualization_model')
     return model
 
-def siamese_network_page():
+# Visualization phases: (layer name, label, description)
+VISUALIZATION_PHASES = [
+    ("vis_conv1", "After First Conv", "Feature maps after the first convolution"),
+    ("vis_leaky1", "After First LeakyReLU", "After first activation"),
+    ("vis_pool1", "After First MaxPool", "After first pooling"),
+    ("vis_conv2", "After Second Conv", "Feature maps after the second convolution"),
+    ("vis_leaky2", "After Second LeakyReLU", "After second activation"),
+    ("vis_pool2", "After Second MaxPool", "After second pooling"),
+    ("vis_flatten", "After Flatten", "Flattened features"),
+    ("vis_dense", "After Dense(8)", "Final feature embedding")
+]
+
+# Shared Siamese layers and their counterparts in the visualization network
+SHARED_LAYERS = ["conv1", "conv2", "dense"]
+
+@st.cache_resource
+def load_siamese_model():
+    """Build the Siamese network once per process, with trained weights if available."""
+    from memory_governor import get_governor
+
+    model = build_siamese_network()
+    if os.path.exists(SIAMESE_WEIGHTS):
+        model.load_weights(SIAMESE_WEIGHTS)
+    get_governor().track("siamese_model", model)
+    return model
+
+@st.cache_resource
+def load_layer_output_model():
+    """Build the visualization network once per process, exposing every phase as an output."""
+    from keras.models import Model
+    from memory_governor import get_governor
+
+    # The visualization network shares the Siamese network's weights
+    vis_model = build_visualization_network()
+    siamese = load_siamese_model()
+    for name in SHARED_LAYERS:
+        vis_model.get_layer(f"vis_{name}").set_weights(siamese.get_layer(name).get_weights())
+    model = Model(
+        inputs=vis_model.input,
+        outputs=[vis_model.get_layer(name).output for name, _, _ in VISUALIZATION_PHASES],
+        name='intermediate_all_phases'
+    )
+    get_governor().track("siamese_layer_output_model", model)
+    return model
+
+def attack_character(char_name, attack_type, strength):
+    """Return the (optionally attacked) sample character from the shared speculative cache."""
+    from image_utils import load_sample_characters
+    from speculation import cached_result
+
+    return cached_result("attack", load_sample_characters()[char_name], attack_type, strength)
+
+def preprocess_image(image):
+    import numpy as np
+
+    img_array = np.array(image.convert("L").resize((28, 28))).astype("float32") / 255.0
+    return np.expand_dims(img_array, axis=(0, -1))
+
+@st.cache_resource
+def load_numpy_engine():
+    """NumPy inference engine, from the .npz export or (without one) the Keras model's weights."""
+    from numpy_siamese import SiameseEngine, export_weights
+
+    if os.path.exists(SIAMESE_NPZ):
+        return SiameseEngine(SIAMESE_NPZ)
+    return SiameseEngine(export_weights(load_siamese_model()))
+
+@st.cache_data(max_entries=32)
+def compute_layer_outputs(batch, backend="Keras"):
+    """Run a (N, 28, 28, 1) batch through every phase in a single forward pass."""
+    if backend == "NumPy":
+        return load_numpy_engine().layer_outputs(batch)
+    outputs = load_layer_output_model().predict(batch, verbose=0)
+    return {name: output for (name, _, _), output in zip(VISUALIZATION_PHASES, outputs)}
+
+def backend_weights(backend):
+    """(weights, where they came from) of the network a backend runs."""
+    from numpy_siamese import export_weights
+
+    keras_source = SIAMESE_WEIGHTS if os.path.exists(SIAMESE_WEIGHTS) else "random initialisation"
+    if backend == "NumPy":
+        return load_numpy_engine().weights, SIAMESE_NPZ if os.path.exists(SIAMESE_NPZ) else keras_source
+    return export_weights(load_siamese_model()), keras_source
+
+@st.cache_data
+def load_verification_calibration(backend="Keras"):
+    """Calibration for the backend's weights: the stored one if it matches them, else the sample gallery's."""
+    from calibration import calibration_for_weights
+    from results_store import RESULTS_STORE
+
+    return calibration_for_weights(*backend_weights(backend), RESULTS_STORE)
+
+def score_embeddings(embeddings_a, embeddings_b, backend="Keras"):
+    """Similarity scores of paired embeddings, from the same backend that produced them."""
+    import numpy as np
+
+    if backend == "NumPy":
+        return load_numpy_engine().score_embeddings(embeddings_a, embeddings_b)
+    head = load_siamese_model().get_layer('similarity')
+    return np.asarray(head(np.abs(embeddings_a - embeddings_b)))[:, 0]
+
+@st.cache_resource
+def load_saliency_fn():
+    """Compile the batched saliency pass once per process."""
+    from saliency import make_saliency_fn
+
+    return make_saliency_fn(load_layer_output_model(), load_siamese_model().get_layer('similarity'))
+
+@st.cache_data(max_entries=32)
+def compute_saliency_maps(clean_a, attacked_a, clean_b, attacked_b):
+    """Saliency maps for all four images, cached by the hash of the input arrays."""
+    from saliency import compute_saliency
+
+    return compute_saliency(load_saliency_fn(), clean_a, attacked_a, clean_b, attacked_b)
+
+@st.fragment
+def saliency_fragment(images, saliency):
+    """Overlay selector and the four saliency overlays; reruns on its own."""
+    from saliency import SALIENCY_ROWS, overlay_heatmap
+
+    map_type = st.radio(
+        "Map", ["Grad-CAM (vis_conv2)", "Input Gradient"], horizontal=True, key="saliency_map"
+    )
+    alpha = st.slider("Overlay Opacity", 0.0, 1.0, 0.5, key="saliency_alpha")
+    maps = saliency["grad_cam"] if map_type.startswith("Grad-CAM") else saliency["gradient"]
+
+    scores = saliency["scores"]
+    col1, col2 = st.columns(2)
+    col1.metric("Similarity (clean A vs clean B)", f"{scores[0]:.4f}")
+    col2.metric("Similarity (attacked A vs attacked B)", f"{scores[1]:.4f}", delta=f"{scores[1] - scores[0]:+.4f}")
+
+    cols = st.columns(len(SALIENCY_ROWS))
+    for col, label, image, heat in zip(cols, SALIENCY_ROWS, images, maps):
+        with col:
+            st.image(overlay_heatmap(image[0], heat, alpha), caption=label, use_container_width=True)
+
+@st.fragment
+def layer_visualization_fragment(layer_outputs):
+    """Phase selector and plots; reruns on its own when the phase changes."""
     import matplotlib.pyplot as plt
+    from memory_governor import show_figure
+
+    # UI for phase selection
+    phase_labels = [label for _, label, _ in VISUALIZATION_PHASES]
+    phase = st.selectbox("Select Phase to Visualize", phase_labels)
+    phase_idx = phase_labels.index(phase)
+    layer_name, _, layer_info = VISUALIZATION_PHASES[phase_idx]
+
+    st.info(layer_info)
+
+    # Outputs for both images at the selected phase
+    output_a = layer_outputs[layer_name][0:1]
+    output_b = layer_outputs[layer_name][1:2]
+
+    colA, colB = st.columns(2)
+    
+    def display_output(output, title, column):
+        with column:
+            st.markdown(f"**{title}**")
+            if len(output.shape) == 4:
+                # For convolutional and pooling layers - show feature maps as images
+                num_filters = output.shape[-1]
+                st.write(f"{num_filters} Feature Maps (showing up to 5)")
+                n_display = min(num_filters, 5)
+                fig, axes = plt.subplots(1, n_display, figsize=(15, 5))
+                if n_display == 1:
+                    axes = [axes]
+                for i in range(n_display):
+                    axes[i].imshow(output[0, :, :, i], cmap="viridis")
+                    axes[i].axis("off")
+                show_figure(fig)
+            elif len(output.shape) == 2:
+                # For flattened and dense layers - show feature distributions
+                st.write(f"Feature Vector Shape: {output.shape}")
+                if layer_name == 'vis_flatten':
+                    st.markdown("""
+                        > **Flattened Features:**  
+                        > This histogram shows the distribution of values after converting the 2D feature maps into a 1D vector.
+                        > Each bar represents one flattened pixel value from the previous layer's feature maps.
+                    """)
+                elif layer_name == 'vis_dense':
+                    st.markdown("""
+                        > **Dense Layer Features:**  
+                        > This histogram shows the learned feature values after dimensionality reduction.
+                        > Each bar represents a different learned high-level feature that the network uses for comparison.
+                    """)
+                
+                # Create a more informative histogram
+                fig, ax = plt.subplots(figsize=(10, 4))
+                ax.hist(output[0], bins=30, edgecolor='black')
+                ax.set_title(f'Distribution of {layer_name} Features')
+                ax.set_xlabel('Feature Value')
+                ax.set_ylabel('Count')
+                show_figure(fig)
+                
+                # Also show the actual feature values
+                st.write("Feature Values:")
+                st.line_chart(output[0])
+            else:
+                st.write(f"Output: {output}")
+
+    display_output(output_a, "Image A", colA)
+    display_output(output_b, "Image B", colB)
+
+def siamese_network_page():
     import numpy as np
-    from PIL import Image
+    from calibration import near_chance
     from image_utils import load_sample_characters
-    from attacks import apply_attack
-    from keras.models import Model
+    from speculation import STRENGTH_STEP, speculate_neighbours
 
     st.title("🔗 Siamese Network Visualization")
 
@@ -102,6 +316,16 @@ def siamese_network_page():
         "> - Analyze feature maps and embeddings at each stage.\n"
     )
 
+    if DEFAULT_BACKEND is None:
+        st.warning(
+            f"Unknown FALCONNET_SIAMESE_BACKEND '{REQUESTED_BACKEND}' (expected one of {', '.join(BACKENDS)}); "
+            "using Keras."
+        )
+    backend = st.radio(
+        "Inference Backend", BACKENDS, index=BACKENDS.index(DEFAULT_BACKEND or "Keras"), horizontal=True, key="siamese_backend",
+        help="NumPy runs the same network without TensorFlow; saliency maps need Keras.",
+    )
+
     # Load sample characters
     characters = load_sample_characters()
     char_names = list(characters.keys())
@@ -111,21 +335,19 @@ def siamese_network_page():
     with col1:
         st.subheader("Select First Image")
         selected_char_a = st.selectbox("Choose Image A", char_names, key="image_a")
-        image_a = characters[selected_char_a]
         # Attack options for Image A
         attack_type_a = st.selectbox("Attack Type for Image A", ["None", "FGSM", "PGD"], key="attack_a")
-        attack_strength_a = st.slider("Attack Intensity for Image A", 0.0, 10.0, 0.0, key="strength_a")
-        attacked_image_a = apply_attack(image_a, attack_type_a, attack_strength_a) if attack_type_a != "None" and attack_strength_a > 0 else image_a
+        attack_strength_a = st.slider("Attack Intensity for Image A", 0.0, 10.0, 0.0, step=STRENGTH_STEP, key="strength_a")
+        attacked_image_a = attack_character(selected_char_a, attack_type_a, attack_strength_a)
         st.image(attacked_image_a, caption="Image A (Attacked)", use_container_width=True)
 
     with col2:
         st.subheader("Select Second Image")
         selected_char_b = st.selectbox("Choose Image B", char_names, key="image_b")
-        image_b = characters[selected_char_b]
         # Attack options for Image B
         attack_type_b = st.selectbox("Attack Type for Image B", ["None", "FGSM", "PGD"], key="attack_b")
-        attack_strength_b = st.slider("Attack Intensity for Image B", 0.0, 10.0, 0.0, key="strength_b")
-        attacked_image_b = apply_attack(image_b, attack_type_b, attack_strength_b) if attack_type_b != "None" and attack_strength_b > 0 else image_b
+        attack_strength_b = st.slider("Attack Intensity for Image B", 0.0, 10.0, 0.0, step=STRENGTH_STEP, key="strength_b")
+        attacked_image_b = attack_character(selected_char_b, attack_type_b, attack_strength_b)
         st.image(attacked_image_b, caption="Image B (Attacked)", use_container_width=True)
 
     st.markdown("---")
@@ -135,97 +357,65 @@ def siamese_network_page():
         "> - Select a phase to view the intermediate output for both images.\n"
     )
 
-    # Preprocess images
-    def preprocess_image(image):
-        img_array = np.array(image.convert("L").resize((28, 28))).astype("float32") / 255.0
-        return np.expand_dims(img_array, axis=(0, -1))
-
-    img_a = preprocess_image(attacked_image_a)
-    img_b = preprocess_image(attacked_image_b)
-
-    # Build the visualization network
-    vis_model = build_visualization_network()
+    # Both images go through the network in one cached forward pass
+    batch = np.concatenate([preprocess_image(attacked_image_a), preprocess_image(attacked_image_b)])
+    layer_outputs = compute_layer_outputs(batch, backend)
 
-    # Define the visualization phases
-    visualization_phases = [
-        ("vis_conv1", "After First Conv", "Feature maps after the first convolution"),
-        ("vis_leaky1", "After First LeakyReLU", "After first activation"),
-        ("vis_pool1", "After First MaxPool", "After first pooling"),
-        ("vis_conv2", "After Second Conv", "Feature maps after the second convolution"),
-        ("vis_leaky2", "After Second LeakyReLU", "After second activation"),
-        ("vis_pool2", "After Second MaxPool", "After second pooling"),
-        ("vis_flatten", "After Flatten", "Flattened features"),
-        ("vis_dense", "After Dense(8)", "Final feature embedding")
-    ]
+    layer_visualization_fragment(layer_outputs)
 
-    # UI for phase selection
-    phase_labels = [label for _, label, _ in visualization_phases]
-    phase = st.selectbox("Select Phase to Visualize", phase_labels)
-    phase_idx = phase_labels.index(phase)
-    layer_name, _, layer_info = visualization_phases[phase_idx]
-
-    st.info(layer_info)
-
-    # Create intermediate model for the selected phase
-    intermediate_model = Model(
-        inputs=vis_model.input,
-        outputs=vis_model.get_layer(layer_name).output,
-        name=f'intermediate_{layer_name}'
+    st.markdown("---")
+    st.header("Verification Decision")
+    st.markdown(
+        "> **Would the network accept A and B as the same character?**\n"
+        "> - The threshold is calibrated on all clean gallery pairs (maximising TPR - FPR).\n"
+        "> - See the Metrics page for the ROC curves under attack.\n"
+    )
+    summary, _, skipped = load_verification_calibration(backend)
+    if skipped is not None:
+        st.warning(
+            f"The stored calibration was computed with other weights (`{skipped}`); "
+            "using a calibration of the current weights on the bundled sample gallery instead."
+        )
+    clean = summary.iloc[0]
+    embeddings = layer_outputs["vis_dense"]
+    score = float(score_embeddings(embeddings[0:1], embeddings[1:2], backend)[0])
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Similarity (A vs B)", f"{score:.4f}")
+    if near_chance(clean["AUC"]):
+        # Any threshold is as good as a coin flip, so no decision is shown
+        col2.metric("Calibrated Threshold", "–")
+        col3.metric("Decision", "–")
+        st.warning(
+            f"The similarity score does not separate same from different characters on the clean gallery "
+            f"(AUC {clean['AUC']:.3f}, about chance), so no calibrated decision can be made. "
+            "Train the network or load trained weights, then recompute the calibration."
+        )
+    else:
+        col2.metric("Calibrated Threshold", f"{clean['Threshold']:.4f}")
+        col3.metric("Decision", "Same character" if score >= clean["Threshold"] else "Different characters")
+    st.caption(
+        f"Clean gallery: AUC {clean['AUC']:.3f} · EER {clean['EER']:.1%} · "
+        f"TPR {clean['TPR']:.1%} / FPR {clean['FPR']:.1%} at the threshold ({int(clean['Pairs']):,} pairs)"
     )
 
-    # Get outputs for both images
-    output_a = intermediate_model.predict(img_a)
-    output_b = intermediate_model.predict(img_b)
-
-    colA, colB = st.columns(2)
-    
-    def display_output(output, title, column):
-        with column:
-            st.markdown(f"**{title}**")
-            if len(output.shape) == 4:
-                # For convolutional and pooling layers - show feature maps as images
-                num_filters = output.shape[-1]
-                st.write(f"{num_filters} Feature Maps (showing up to 5)")
-                n_display = min(num_filters, 5)
-                fig, axes = plt.subplots(1, n_display, figsize=(15, 5))
-                if n_display == 1:
-                    axes = [axes]
-                for i in range(n_display):
-                    axes[i].imshow(output[0, :, :, i], cmap="viridis")
-                    axes[i].axis("off")
-                st.pyplot(fig)
-            elif len(output.shape) == 2:
-                # For flattened and dense layers - show feature distributions
-                st.write(f"Feature Vector Shape: {output.shape}")
-                if layer_name == 'vis_flatten':
-                    st.markdown("""
-                        > **Flattened Features:**  
-                        > This histogram shows the distribution of values after converting the 2D feature maps into a 1D vector.
-                        > Each bar represents one flattened pixel value from the previous layer's feature maps.
-                    """)
-                elif layer_name == 'vis_dense':
-                    st.markdown("""
-                        > **Dense Layer Features:**  
-                        > This histogram shows the learned feature values after dimensionality reduction.
-                        > Each bar represents a different learned high-level feature that the network uses for comparison.
-                    """)
-                
-                # Create a more informative histogram
-                fig, ax = plt.subplots(figsize=(10, 4))
-                ax.hist(output[0], bins=30, edgecolor='black')
-                ax.set_title(f'Distribution of {layer_name} Features')
-                ax.set_xlabel('Feature Value')
-                ax.set_ylabel('Count')
-                st.pyplot(fig)
-                
-                # Also show the actual feature values
-                st.write("Feature Values:")
-                st.line_chart(output[0])
-            else:
-                st.write(f"Output: {output}")
+    st.markdown("---")
+    st.header("Saliency: Clean vs Attacked")
+    st.markdown(
+        "> **Which pixels drive the similarity score, and how does the attack shift them?**\n"
+        "> - **Grad-CAM** weights the `vis_conv2` feature maps by their gradients to highlight important regions.\n"
+        "> - **Input Gradient** shows how sensitive the score is to each pixel.\n"
+    )
+    if backend == "Keras":
+        images = [
+            preprocess_image(characters[selected_char_a]), batch[0:1],
+            preprocess_image(characters[selected_char_b]), batch[1:2],
+        ]
+        saliency_fragment(images, compute_saliency_maps(*images))
+    else:
+        st.info("Saliency maps need gradients; switch the inference backend to Keras to compute them.")
 
-    display_output(output_a, "Image A", colA)
-    display_output(output_b, "Image B", colB)
+    # Precompute the attacked images for the neighbouring slider settings
+    speculate_neighbours("siamese_a", "attack", characters[selected_char_a], attack_type_a, attack_strength_a)
+    speculate_neighbours("siamese_b", "attack", characters[selected_char_b], attack_type_b, attack_strength_b)
 
     st.markdown("---")
-
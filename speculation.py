@@ -0,0 +1,352 @@
+"""
+Speculative Precomputation Module
+-------------------------------
+This module keeps slider moves responsive by computing likely next results
+before they are requested:
+- After a result is shown, background worker threads compute the results for
+  the neighbouring attack strengths and for the other attack types
+- Results go into a cache shared by all sessions, so the next slider move
+  (by this or any other user) is served without recomputation
+- Speculative work is limited by a CPU budget, measured as worker CPU time
+  over a sliding window
+- Pending work is cancelled when the user switches to another image or page,
+  or when the session has been idle for longer than the session TTL
+
+Two kinds of results are cached:
+- "attack": the attacked image
+- "analysis": the attacked image with its difference, perturbation metrics
+  and rendered difference heatmap
+
+Configuration (environment variables):
+- FALCONNET_SPECULATION_WORKERS: worker threads (default 1, 0 disables speculation)
+- FALCONNET_SPECULATION_CPU: CPU budget in cores, averaged over 10 s (default 0.5)
+- FALCONNET_SPECULATION_ENTRIES: cached results (default 512)
+- FALCONNET_SESSION_TTL_S: idle time after which a session's pending work is
+  cancelled (default 1800, shared with the memory governor)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import streamlit as st
+
+STRENGTH_RANGE = (0.0, 10.0)
+# Step of the "Attack Strength" sliders; neighbours are one step away
+STRENGTH_STEP = 0.5
+ATTACK_TYPES = ("FGSM", "PGD")
+
+
+def attack_image(image, attack_type, strength):
+    """The attacked image, or ``image`` itself when there is nothing to apply."""
+    from attacks import apply_attack
+
+    if attack_type == "None" or strength <= 0:
+        return image
+    return apply_attack(image, attack_type, strength)
+
+
+def analyse_attack(image, attack_type, strength):
+    """
+    Attack an image and compute everything the attack playgrounds display.
+
+    Returns:
+    --------
+    dict
+        {"attacked": PIL.Image, "diff": numpy.ndarray,
+         "metrics": pandas.DataFrame, "heatmap": PNG bytes}
+    """
+    from image_utils import compute_difference, compute_difference_heatmap, compute_perturbation_metrics, figure_to_png
+
+    attacked = attack_image(image, attack_type, strength)
+    diff = compute_difference(image, attacked)
+    return {
+        "attacked": attacked,
+        "diff": diff,
+        "metrics": compute_perturbation_metrics(image, attacked, diff=diff),
+        "heatmap": figure_to_png(compute_difference_heatmap(None, None, small=True, diff=diff)),
+    }
+
+
+TASKS = {"attack": attack_image, "analysis": analyse_attack}
+
+
+def image_key(image):
+    """Content hash identifying an image in cache keys."""
+    digest = hashlib.blake2b(image.tobytes(), digest_size=16).hexdigest()
+    return f"{image.mode}:{image.width}x{image.height}:{digest}"
+
+
+def neighbour_settings(attack_type, strength, attack_types=ATTACK_TYPES, step=STRENGTH_STEP):
+    """
+    Settings a user is likely to pick next, nearest first.
+
+    These are the adjacent strengths for the current attack, then the current
+    strength for each other attack type.
+    """
+    low, high = STRENGTH_RANGE
+    settings = []
+    if attack_type != "None":
+        for candidate in (strength + step, strength - step):
+            if low <= candidate <= high:
+                settings.append((attack_type, round(candidate, 6)))
+    settings += [(other, strength) for other in attack_types if other != attack_type]
+    return settings
+
+
+class SpeculativeExecutor:
+    """
+    Shared result cache with background precomputation.
+
+    Parameters:
+    -----------
+    max_workers : int
+        Worker threads for speculative tasks (0 disables speculation)
+    cpu_budget : float
+        Worker CPU time allowed per second of wall time, averaged over ``window``
+    window : float
+        Length in seconds of the CPU accounting window
+    max_entries : int
+        Cached results kept, least recently used evicted first
+    session_ttl : float
+        Seconds after a session's last speculation at which its pending work is cancelled
+    """
+
+    def __init__(self, max_workers=1, cpu_budget=0.5, window=10.0, max_entries=512, session_ttl=1800.0):
+        self.cpu_budget = cpu_budget
+        self.window = window
+        self.max_entries = max_entries
+        self.session_ttl = session_ttl
+        self.pool = ThreadPoolExecutor(max_workers, thread_name_prefix="speculate") if max_workers > 0 else None
+        self.cache = OrderedDict()
+        self.nbytes = 0
+        self.inflight = {}
+        # session -> {slot: (context, [futures not done yet])}; done futures are
+        # removed by their callback so their results are only held by the cache
+        self.pending = {}
+        self.last_seen = {}  # session -> time of its last speculation, while it has pending work
+        self.cpu_log = deque()  # (finish time, worker CPU seconds)
+        self.stats = Counter()
+        # Reentrant: cancelling a future runs its done callback in this thread
+        self._lock = threading.RLock()
+
+    def get(self, key, compute):
+        """
+        Return the cached result for ``key``, computing it with ``compute`` if needed.
+
+        A result that is still being computed speculatively is waited for
+        rather than computed twice.
+        """
+        with self._lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.cache[key][0]
+            future = self.inflight.get(key)
+        if future is not None:
+            try:
+                result = future.result()
+                with self._lock:
+                    self.stats["joined"] += 1
+                return result
+            except CancelledError:
+                pass
+        result = compute()
+        with self._lock:
+            self.stats["misses"] += 1
+        self._store(key, result)
+        return result
+
+    def speculate(self, session, slot, context, tasks):
+        """
+        Queue speculative tasks for a session.
+
+        Parameters:
+        -----------
+        session : str
+            Session the work is done for
+        slot : str
+            Independent stream of work within the session (e.g. image A or B)
+        context : hashable
+            What the work is about (e.g. the image); pending work of the slot
+            for a different context is cancelled
+        tasks : list of tuple
+            (cache key, zero-argument callable) pairs, most likely first
+        """
+        if self.pool is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for idle, seen in list(self.last_seen.items()):
+                if now - seen > self.session_ttl:
+                    self.cancel(idle)
+            slots = self.pending.setdefault(session, {})
+            previous_context, futures = slots.get(slot, (context, []))
+            if previous_context != context:
+                self._cancel(futures)
+                futures = []
+            for key, compute in tasks:
+                if key in self.cache or key in self.inflight:
+                    continue
+                if self._cpu_used() >= self.cpu_budget * self.window:
+                    self.stats["over budget"] += 1
+                    break
+                future = self.pool.submit(self._run, key, compute)
+                self.inflight[key] = future
+                # Appended first: a future that is already done runs the callback right away
+                futures.append(future)
+                future.add_done_callback(lambda future, key=key: self._forget(key, session, slot, future))
+                self.stats["speculated"] += 1
+            slots[slot] = (context, futures)
+            self._prune(session, slot)
+            if session in self.pending:
+                self.last_seen[session] = now
+
+    def cancel(self, session):
+        """Cancel all of a session's pending speculative work."""
+        with self._lock:
+            self.last_seen.pop(session, None)
+            for _, futures in self.pending.pop(session, {}).values():
+                self._cancel(futures)
+
+    def cpu_usage(self):
+        """Average worker CPU use (cores) over the accounting window."""
+        with self._lock:
+            return self._cpu_used() / self.window
+
+    def _run(self, key, compute):
+        # Checked again at start, as the budget may have been used up while queued
+        with self._lock:
+            if self._cpu_used() >= self.cpu_budget * self.window:
+                self.stats["over budget"] += 1
+                raise CancelledError
+        start = time.thread_time()
+        try:
+            result = compute()
+        finally:
+            with self._lock:
+                self.cpu_log.append((time.monotonic(), time.thread_time() - start))
+        self._store(key, result)
+        return result
+
+    def _store(self, key, result):
+        from memory_governor import estimate_nbytes
+
+        size = estimate_nbytes(result)
+        with self._lock:
+            if key in self.cache:
+                self.nbytes -= self.cache.pop(key)[1]
+            self.cache[key] = (result, size)
+            self.nbytes += size
+            while len(self.cache) > self.max_entries:
+                self.nbytes -= self.cache.popitem(last=False)[1][1]
+
+    def _forget(self, key, session, slot, future):
+        with self._lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+            _, futures = self.pending.get(session, {}).get(slot, (None, []))
+            if future in futures:
+                futures.remove(future)
+                self._prune(session, slot)
+
+    def _prune(self, session, slot):
+        # Drop a slot without pending work, and the session once it has none left
+        slots = self.pending.get(session, {})
+        if slot in slots and not slots[slot][1]:
+            del slots[slot]
+        if session in self.pending and not slots:
+            del self.pending[session]
+            self.last_seen.pop(session, None)
+
+    def _cancel(self, futures):
+        # Tasks that already started run to completion and are still cached;
+        # cancelling runs the done callback, which removes the future from ``futures``
+        for future in list(futures):
+            if future.cancel():
+                self.stats["cancelled"] += 1
+
+    def _cpu_used(self):
+        horizon = time.monotonic() - self.window
+        while self.cpu_log and self.cpu_log[0][0] < horizon:
+            self.cpu_log.popleft()
+        return sum(cpu for _, cpu in self.cpu_log)
+
+
+@st.cache_resource
+def get_speculator():
+    """The process-wide speculative executor, configured from the environment."""
+    return SpeculativeExecutor(
+        max_workers=int(os.environ.get("FALCONNET_SPECULATION_WORKERS", 1)),
+        cpu_budget=float(os.environ.get("FALCONNET_SPECULATION_CPU", 0.5)),
+        max_entries=int(os.environ.get("FALCONNET_SPECULATION_ENTRIES", 512)),
+        session_ttl=float(os.environ.get("FALCONNET_SESSION_TTL_S", 1800)),
+    )
+
+
+def cached_result(kind, image, attack_type, strength):
+    """
+    Result of ``TASKS[kind]`` for an image and attack setting, from the shared cache.
+
+    Parameters:
+    -----------
+    kind : str
+        "attack" or "analysis"
+    image : PIL.Image
+        Image to attack
+    attack_type : str
+        "FGSM", "PGD" or "None"
+    strength : float
+        Attack strength
+    """
+    from memory_governor import get_governor
+
+    speculator = get_speculator()
+    key = (kind, image_key(image), attack_type, float(strength))
+    result = speculator.get(key, lambda: TASKS[kind](image, attack_type, strength))
+    get_governor().track("speculation_cache", None, kind="images", nbytes=speculator.nbytes)
+    return result
+
+
+def speculate_neighbours(slot, kind, image, attack_type, strength, attack_types=ATTACK_TYPES):
+    """Precompute the neighbouring settings of a result that has just been shown."""
+    from memory_governor import current_session_id
+
+    speculator = get_speculator()
+    image_id = image_key(image)
+    tasks = [
+        ((kind, image_id, other_type, float(other_strength)),
+         lambda other_type=other_type, other_strength=other_strength: TASKS[kind](image, other_type, other_strength))
+        for other_type, other_strength in neighbour_settings(attack_type, strength, attack_types)
+    ]
+    speculator.speculate(current_session_id(), slot, (kind, image_id), tasks)
+
+
+def cancel_speculation():
+    """Cancel this session's pending speculative work (e.g. on a page switch)."""
+    from memory_governor import current_session_id
+
+    get_speculator().cancel(current_session_id())
+
+
+def render_speculation_sidebar():
+    """Show cache and CPU statistics of the speculative executor in the sidebar."""
+    speculator = get_speculator()
+    stats = speculator.stats
+    served = stats["hits"] + stats["joined"] + stats["misses"]
+    with st.sidebar.expander("⚡ Speculation", expanded=False):
+        if speculator.pool is None:
+            st.caption("Disabled (FALCONNET_SPECULATION_WORKERS=0)")
+        st.metric("Served from cache", f"{(stats['hits'] + stats['joined']) / served:.0%}" if served else "–")
+        st.caption(
+            f"Cached results: {len(speculator.cache)} / {speculator.max_entries} · "
+            f"in flight: {len(speculator.inflight)}"
+        )
+        st.caption(
+            f"Worker CPU: {speculator.cpu_usage():.2f} / {speculator.cpu_budget:.2f} cores · "
+            f"speculated: {stats['speculated']} · cancelled: {stats['cancelled']} · "
+            f"skipped over budget: {stats['over budget']}"
+        )